@@ -1,37 +1,120 @@
+import collections
+import pandas as pd
 import streamlit as st
 import utils.files_utils as files_utils
+import utils.ingest_utils as ingest_utils
+import utils.perf_utils as perf_utils
+import utils.workspace_utils as workspace_utils
 from modules import random_split, targeted_split, validation
 
 
 st.set_page_config(page_title="Customer Success Platform", layout="wide")
 
+# Each browser session gets its own upload and output folders
+workspace_utils.cleanup_workspaces()
+if "workspace" not in st.session_state:
+    st.session_state["workspace"] = workspace_utils.create_workspace()
+workspace_utils.touch(st.session_state["workspace"])
+
+# Stage timings of this session (load, filter, split, plot, save) for the diagnostics panel
+if "diagnostics" not in st.session_state:
+    st.session_state["diagnostics"] = collections.deque(maxlen=200)
+perf_utils.set_sink(st.session_state["diagnostics"])
+
 st.sidebar.title("Global Controls")
 
 uploaded_file = st.sidebar.file_uploader(
     "Drag & Drop or Click to Upload",
-    type=["csv", "xlsx", "sav"]
+    type=["csv", "xlsx", "sav", "zsav"]
 )
 
+# Compact dtypes cut the memory a dataset holds per session; outputs are written with the original dtypes
+st.sidebar.toggle("Compact memory mode", value=True, key="optimize_dtypes",
+                  help="Stores coded answers as small integers or categories. Output files are unchanged.")
+
+def _release_ingestion():
+    # Stops waiting for a load that is no longer wanted (cancelling it unless another session shares it)
+    if "ingestion" in st.session_state:
+        ingest_utils.release(st.session_state.pop("ingestion")[1])
+
+
+@st.fragment(run_every=0.5)
+def show_ingestion():
+    """Parsing progress of the upload loading in the background; a full rerun publishes it once done."""
+    _, ingestion = st.session_state["ingestion"]
+    if ingestion.done.is_set():
+        st.rerun()
+    st.progress(ingestion.progress, text=f"⏳ {ingestion.name}: {ingestion.message}...")
+
+
 if uploaded_file:
     try:
-        file_path = files_utils.save_uploaded_file(uploaded_file)
-        data, meta = files_utils.load_file(file_path)
-
-        if data is not None:
-            st.session_state["data"] = data
-            st.session_state["meta"] = meta
-            st.session_state["file_path"] = file_path
-            print(file_path)
-            file_type = st.session_state["file_type"] = file_path.split(".")[1]
-            st.sidebar.success(f"✅ {file_type.upper()} file successfully loaded!")
+        # Workbooks load one sheet at a time; the sheet list comes from the workbook index only
+        sheet_name = None
+        if uploaded_file.name.lower().endswith(".xlsx"):
+            sheets = files_utils.list_sheets(uploaded_file)
+            if len(sheets) > 1:
+                sheet_name = st.sidebar.selectbox("Sheet", sheets, key="sheet_name")
+
+        upload_id = f"{uploaded_file.file_id}:{st.session_state['optimize_dtypes']}:{sheet_name}"
+        failed = st.session_state.get("upload_error", (None,))[0] == upload_id
+
+        # Files load in a background thread so the app stays usable; reruns with the same upload
+        # reuse what is already loaded or loading, and a new upload cancels the previous one's load
+        if st.session_state.get("upload_id") != upload_id and not failed:
+            if st.session_state.get("ingestion", (None,))[0] != upload_id:
+                _release_ingestion()
+                ingestion = ingest_utils.start(
+                    uploaded_file, folder=workspace_utils.workspace_path(st.session_state["workspace"], "uploads"),
+                    optimize=st.session_state["optimize_dtypes"], sheet_name=sheet_name, sink=st.session_state["diagnostics"]
+                )
+                st.session_state["ingestion"] = (upload_id, ingestion)
+
+            ingestion = st.session_state["ingestion"][1]
+            if ingestion.done.is_set():
+                _release_ingestion()
+                if ingestion.result is not None:
+                    data, meta, file_hash, file_path = ingestion.result
+                    st.session_state["data"] = data
+                    st.session_state["meta"] = meta
+                    st.session_state["file_path"] = file_path
+                    workspace_utils.set_dataset(st.session_state["workspace"], file_path)
+                    # Keys the per-dataset caches of the tabs, so each sheet of a workbook gets its own
+                    st.session_state["file_hash"] = file_hash if sheet_name is None else f"{file_hash}:{sheet_name}"
+                    st.session_state["file_type"] = uploaded_file.name.rsplit(".", 1)[-1].lower()
+                    st.session_state["sheet"] = sheet_name  # Jobs load this sheet when file_path is the workbook itself
+                    st.session_state["upload_id"] = upload_id
+                else:
+                    st.session_state["upload_error"] = (upload_id, ingestion.error)
+                    failed = True
+
+        if st.session_state.get("upload_id") == upload_id:
+            st.sidebar.success(f"✅ {st.session_state['file_type'].upper()} file successfully loaded!")
+        elif failed:
+            st.sidebar.error(f"❌ Error Uploading: {st.session_state['upload_error'][1]}")
         else:
-            st.sidebar.error(f"❌ Error Uploading")
+            with st.sidebar:
+                show_ingestion()
     except Exception as e:
         st.sidebar.error(f"❌ Error loading file: {str(e)}")
 
 else:
+    _release_ingestion()
     st.sidebar.info("📂 Upload a file to begin.")
 
+# Outputs use the upload's format; SAV ones can be written compressed instead
+if "file_type" in st.session_state:
+    st.session_state["output_type"] = st.session_state["file_type"]
+    if st.session_state["file_type"] in ("sav", "zsav"):
+        compress = st.sidebar.toggle("Compressed SAV output (.zsav)", value=st.session_state["file_type"] == "zsav",
+                                     key="compress_sav", help="Much smaller files with the same data and metadata.")
+        st.session_state["output_type"] = "zsav" if compress else "sav"
+
+    # A manifest records the seed and row assignments only; files are rebuilt from it with `cli.py materialize`
+    output_format = st.sidebar.radio("Split outputs", ["Data files", "Manifest"], horizontal=True, key="output_format_choice",
+                                     help="A manifest is a tiny file from which any split file can be rebuilt later.")
+    st.session_state["output_format"] = "manifest" if output_format == "Manifest" else "files"
+
 # Title
 st.title("Customer Success Platform 🚀")
 
@@ -56,3 +139,13 @@ with tab_validation:
         validation.app()
     else:
         st.warning("⚠️ Please upload a dataset.")
+
+with st.sidebar.expander("🩺 Diagnostics", expanded=False):
+    if st.session_state["diagnostics"]:
+        stages = pd.DataFrame(list(st.session_state["diagnostics"])[::-1])
+        st.dataframe(stages, hide_index=True, use_container_width=True)
+        if st.button("Clear", key="clear_diagnostics"):
+            st.session_state["diagnostics"].clear()
+            st.rerun()
+    else:
+        st.caption("No stages recorded yet.")
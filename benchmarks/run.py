@@ -0,0 +1,192 @@
+"""
+Times the split, filter, file and validation paths on synthetic surveys of growing size,
+reporting throughput and peak memory, so we know which file sizes an instance can handle.
+
+    python -m benchmarks.run                                   # default sizes
+    python -m benchmarks.run --rows 10000 100000 1000000 --columns 200
+    python -m benchmarks.run --save benchmarks/baseline.json   # record a baseline
+    python -m benchmarks.run --compare benchmarks/baseline.json  # flag regressions against it
+
+Peak memory is what tracemalloc sees (Python and NumPy allocations); buffers allocated
+inside pyarrow or pyreadstat are not counted.
+"""
+import argparse
+import filecmp
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_survey
+from modules import validation
+from utils import files_utils, filter_utils, split_utils
+
+# Streamlit warns about every cache used outside a running app
+logging.getLogger("streamlit.runtime.caching.cache_data_api").setLevel(logging.ERROR)
+
+DEFAULT_ROWS = [10_000, 100_000, 500_000]
+REGRESSION_THRESHOLD = 1.25  # Flag cases more than 25% slower than the baseline
+
+
+def measure(func, repeat=3):
+    """Runs func `repeat` times and returns (best seconds, peak bytes of one run, result)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def cases(df, meta_kwargs, workdir):
+    """Yields (name, callable) for every benchmarked path on one dataset."""
+    first, second = df.columns[0], df.columns[1]
+    filters = [{first: [1.0, 2.0], second: [1.0]}]
+    conditions = filter_utils.conditions_from_dicts(filters)
+    half = len(df) // 2
+
+    yield "random_split", lambda: split_utils.random_split(df, train_size=0.1, random_states=[0])
+    yield "random_split_stratified", lambda: split_utils.random_split(df, train_size=0.1, random_states=[0], stratify=[first])
+    yield "targeted_split", lambda: split_utils.targeted_split(df, conditions, train_size=0.1, random_states=[0])
+    yield "filter_dataframe", lambda: split_utils.filter_dataframe(df, filters)
+    yield "bootstrap_split_x20", lambda: split_utils.bootstrap_split(df, 20, seed=0)
+
+    metadata = _Metadata(df, meta_kwargs)
+    for file_type in ("csv", "sav", "zsav"):
+        path = os.path.join(workdir, f"bench.{file_type}")
+        yield f"save_file_{file_type}", lambda path=path: files_utils.save_file(df, path, metadata=metadata)
+        yield f"load_file_{file_type}", lambda path=path: files_utils.load_file(path)
+
+    labels = split_utils.bootstrap_split(df, 1, seed=0)
+    csv_path = os.path.join(workdir, "bench.csv")
+    os.makedirs(os.path.join(workdir, "streamed"), exist_ok=True)
+    jobs = split_utils.output_jobs(labels, os.path.join(workdir, "streamed"), "csv")
+    yield "stream_export_csv", lambda: files_utils.stream_export(csv_path, jobs)
+
+    yield "compare_dataframes_pivot", lambda: validation.compare_dataframes_pivot(df.iloc[:half], df.iloc[half:])
+
+
+def check_stream_export(df, workdir):
+    """
+    Streams one split of df from a CSV in several chunks and returns the outputs that differ,
+    byte for byte, from the in-memory export of the same split.
+    An integer column blank only in its last row checks every chunk is read with the same types.
+    """
+    late_blank = pd.array(np.arange(len(df)), dtype="Int64")
+    late_blank[-1] = pd.NA
+    df = df.assign(late_blank=late_blank)
+    source = os.path.join(workdir, "check.csv")
+    df.to_csv(source, index=False)
+
+    loaded, _ = files_utils.load_file(source)
+    labels = split_utils.bootstrap_split(loaded, 1, seed=0)
+    streamed, in_memory = os.path.join(workdir, "check_streamed"), os.path.join(workdir, "check_in_memory")
+    for folder in (streamed, in_memory):
+        os.makedirs(folder, exist_ok=True)
+    files_utils.stream_export(source, split_utils.output_jobs(labels, streamed, "csv"), chunksize=max(1, len(df) // 4))
+    files_utils.export_files(loaded, split_utils.output_jobs(labels, in_memory, "csv"), max_workers=1)
+    return [name for name in sorted(os.listdir(in_memory))
+            if not filecmp.cmp(os.path.join(streamed, name), os.path.join(in_memory, name), shallow=False)]
+
+
+class _Metadata:
+    """Stand-in for the pyreadstat metadata object save_file reads labels from."""
+
+    def __init__(self, df, meta_kwargs):
+        self.column_names = list(df.columns)
+        self.column_labels = meta_kwargs["column_labels"]
+        self.column_names_to_labels = dict(zip(df.columns, meta_kwargs["column_labels"]))
+        self.variable_value_labels = meta_kwargs["variable_value_labels"]
+        self.missing_ranges = {}
+
+
+def run(rows_list, n_columns, cardinality, repeat):
+    """Returns (results, mismatches), the latter listing streamed outputs that differ from in-memory ones."""
+    results = []
+    mismatches = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in rows_list:
+            df, meta_kwargs = make_survey(n_rows, n_columns, cardinality)
+            for name, func in cases(df, meta_kwargs, workdir):
+                seconds, peak, _ = measure(func, repeat)
+                result = {
+                    "case": name,
+                    "rows": n_rows,
+                    "columns": n_columns,
+                    "seconds": round(seconds, 6),
+                    "rows_per_second": round(n_rows / seconds) if seconds else None,
+                    "peak_mb": round(peak / 2 ** 20, 2),
+                }
+                results.append(result)
+                print(f"{name:<28} {n_rows:>10,} rows  {seconds:9.4f}s  {result['rows_per_second']:>14,} rows/s  {result['peak_mb']:9.1f} MB")
+            mismatches += [(n_rows, name) for name in check_stream_export(df, workdir)]
+    return results, mismatches
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns the results that are slower than their baseline counterpart by more than threshold."""
+    reference = {(r["case"], r["rows"], r["columns"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = reference.get((result["case"], result["rows"], result["columns"]))
+        if previous and result["seconds"] > previous["seconds"] * threshold:
+            regressions.append({**result, "baseline_seconds": previous["seconds"], "ratio": round(result["seconds"] / previous["seconds"], 2)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark split, filter, file and validation paths on synthetic surveys.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Dataset sizes to benchmark")
+    parser.add_argument("--columns", type=int, default=50, help="Number of columns")
+    parser.add_argument("--cardinality", type=int, default=8, help="Distinct answers per coded column")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (the best one is kept)")
+    parser.add_argument("--save", help="Write the results to this baseline file")
+    parser.add_argument("--compare", help="Baseline file to check the results against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore")
+    results, mismatches = run(args.rows, args.columns, args.cardinality, args.repeat)
+    # Unlike tracemalloc, this includes native buffers, but it is the peak over the whole run
+    print(f"Process peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=4)
+        print(f"Baseline saved to {args.save}")
+
+    for n_rows, name in mismatches:
+        print(f"MISMATCH streamed {name} at {n_rows:,} rows differs from the in-memory export")
+    if mismatches:
+        return 1
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} at {r['rows']:,} rows: {r['seconds']:.4f}s vs {r['baseline_seconds']:.4f}s (x{r['ratio']})")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Synthetic survey datasets for benchmarking, shaped like the SAV files we split.
+Can also write one to disk, e.g. to try a file size in the app:
+
+    python -m benchmarks.synthetic survey.sav --rows 1000000 --columns 300
+"""
+import argparse
+import numpy as np
+import pandas as pd
+import pyreadstat
+
+
+def make_survey(n_rows=100_000, n_columns=50, cardinality=8, n_text_columns=2, missing_rate=0.02, seed=0):
+    """
+    Returns (df, meta_kwargs): coded float columns (1.0..cardinality, like pyreadstat output),
+    a few low-cardinality text columns, and the value labels / column labels a SAV file would carry.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    value_labels = {}
+    column_labels = []
+
+    for i in range(n_columns - n_text_columns):
+        name = f"q{i + 1:03d}"
+        # Skewed code distribution, as in real answers
+        weights = rng.dirichlet(np.ones(cardinality))
+        values = rng.choice(np.arange(1, cardinality + 1), size=n_rows, p=weights).astype(float)
+        values[rng.random(n_rows) < missing_rate] = np.nan
+        columns[name] = values
+        value_labels[name] = {float(code): f"Answer {code}" for code in range(1, cardinality + 1)}
+        column_labels.append(f"Question {i + 1}")
+
+    for i in range(n_text_columns):
+        name = f"text{i + 1}"
+        columns[name] = rng.choice([f"category_{k}" for k in range(cardinality)], size=n_rows)
+        column_labels.append(f"Text {i + 1}")
+
+    meta_kwargs = {"column_labels": column_labels, "variable_value_labels": value_labels}
+    return pd.DataFrame(columns), meta_kwargs
+
+
+def write_survey(file_path, df, meta_kwargs):
+    """Writes a synthetic survey as CSV, XLSX or SAV (with its labels)."""
+    if file_path.endswith(".sav"):
+        pyreadstat.write_sav(df, file_path, **meta_kwargs)
+    elif file_path.endswith(".xlsx"):
+        df.to_excel(file_path, index=False)
+    else:
+        df.to_csv(file_path, index=False)
+    return file_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic survey dataset.")
+    parser.add_argument("file_path", help="Output .csv, .xlsx or .sav file")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=50)
+    parser.add_argument("--cardinality", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_survey(args.file_path, *make_survey(args.rows, args.columns, args.cardinality, seed=args.seed))
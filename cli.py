@@ -0,0 +1,77 @@
+"""
+Headless entry point for splitting datasets without the Streamlit app.
+
+    python cli.py split DATASET SPEC.json        # one dataset, spec like user_selections.json or a full spec
+    python cli.py batch JOBS.json [--workers N]  # many datasets in parallel
+    python cli.py materialize MANIFEST DATASET   # rebuild the files of a split saved as a manifest
+    python cli.py update MANIFEST DATASET        # split only the rows a new wave of the dataset added
+
+Heavy libraries are only imported once a command runs, so the CLI starts fast.
+"""
+import argparse
+import json
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split CSV, XLSX or SAV datasets into train / holdout / baseline files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = commands.add_parser("split", help="Split one dataset")
+    split_parser.add_argument("dataset", help="CSV, XLSX or SAV file")
+    split_parser.add_argument("spec", help="JSON split spec, or a user_selections.json filter list")
+    split_parser.add_argument("--output-dir", help="Overrides the spec's output_dir")
+    split_parser.add_argument("--seed", type=int, help="Overrides the spec's seed")
+
+    batch_parser = commands.add_parser("batch", help="Split many datasets from a job file")
+    batch_parser.add_argument("jobs", help='JSON job file: [{"dataset": ..., "spec": ...}, ...]')
+    batch_parser.add_argument("--workers", type=int, help="Number of datasets processed in parallel")
+
+    materialize_parser = commands.add_parser("materialize", help="Rebuild split files from a manifest")
+    materialize_parser.add_argument("manifest", help="manifest.npz written by a split with output_format 'manifest'")
+    materialize_parser.add_argument("dataset", help="The dataset the manifest was made from")
+    materialize_parser.add_argument("--output-dir", default="outputs", help="Where to write the files")
+    materialize_parser.add_argument("--replicate", type=int, action="append", help="Only this replicate (repeatable)")
+    materialize_parser.add_argument("--part", choices=["train", "holdout", "baseline"], action="append", help="Only this part (repeatable)")
+    materialize_parser.add_argument("--file-type", help="Output format; defaults to the split's")
+    materialize_parser.add_argument("--streaming", action="store_true", help="Stream CSV/SAV datasets instead of loading them whole")
+    materialize_parser.add_argument("--sheet", help="Workbook sheet the split was made from; defaults to the split's")
+
+    update_parser = commands.add_parser("update", help="Split the new rows of a grown dataset into an existing split")
+    update_parser.add_argument("manifest", help="manifest.npz of the previous split (in its output directory)")
+    update_parser.add_argument("dataset", help="The new wave of the dataset")
+
+    args = parser.parse_args(argv)
+
+    from utils import batch_utils, manifest_utils
+
+    if args.command == "materialize":
+        try:
+            outputs, errors = manifest_utils.materialize(
+                args.manifest, args.dataset, args.output_dir, file_type=args.file_type,
+                replicates=args.replicate, parts=args.part, streaming=args.streaming, sheet=args.sheet
+            )
+            errors = {path: error["error"] for path, error in errors.items()}
+        except Exception as e:
+            outputs, errors = [], {args.manifest: str(e)}
+        results = [{"dataset": args.dataset, "manifest": args.manifest, "outputs": outputs, "errors": errors}]
+    elif args.command == "update":
+        results = [batch_utils.run_incremental(args.dataset, args.manifest)]
+    elif args.command == "split":
+        spec = batch_utils.load_spec(args.spec)
+        if args.output_dir:
+            spec["output_dir"] = args.output_dir
+        if args.seed is not None:
+            spec["seed"] = args.seed
+        results = [batch_utils.run_split(args.dataset, spec)]
+    else:
+        jobs, max_workers = batch_utils.load_jobs(args.jobs)
+        results = batch_utils.run_jobs(jobs, max_workers=args.workers or max_workers)
+
+    json.dump(results, sys.stdout, indent=4)
+    print()
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import os
+import pandas as pd
+import streamlit as st
+from utils import queue_utils, workspace_utils
+
+
+DOWNLOAD_MAX_BYTES = 512 << 20  # Larger outputs are not zipped in memory for the browser
+SPLIT_JOBS = ("random_split_job", "targeted_split_job")  # Session keys of the split jobs, which share the outputs folder
+
+
+def split_job_running():
+    """Whether one of this session's split jobs is still queued or running (and writing to the outputs folder)."""
+    for state_key in SPLIT_JOBS:
+        job_id = st.session_state.get(state_key)
+        job = queue_utils.status(job_id) if job_id else None
+        if job and job["status"] in ("queued", "running"):
+            return True
+    return False
+
+
+def show_job_status(state_key, outputs_dir):
+    """
+    Shows the background split job stored under `state_key`: a polling progress bar while it runs,
+    then its outcome and a download of the outputs.
+    """
+    job_id = st.session_state.get(state_key)
+    job = queue_utils.status(job_id) if job_id else None
+    if job is None:
+        return
+
+    if job["status"] in ("queued", "running"):
+        _poll_job(state_key)
+    elif job["status"] == "done":
+        st.success("Data has been successfully split!")
+        if job["spec"]["output_format"] == "manifest":
+            st.caption("The split was saved as a manifest. Rebuild its files with "
+                       "`python cli.py materialize manifest.npz <dataset>`.")
+        _download_outputs(job_id, outputs_dir)
+        if job["result"].get("bootstrap"):
+            _show_bootstrap_summary(job_id, job["result"], outputs_dir)
+    else:
+        errors = job["result"]["errors"] if job["result"] else {job["dataset"]: job["message"]}
+        for path, error in errors.items():
+            st.error(f"❌ Error saving {path}: {error}")
+
+
+@st.fragment(run_every=1.0)
+def _poll_job(state_key):
+    job = queue_utils.status(st.session_state[state_key])
+    if job["status"] not in ("queued", "running"):
+        st.rerun()  # Stop polling and let the full page show the outcome
+
+    label = "Waiting for a worker..." if job["status"] == "queued" else (job["message"] or "Splitting...")
+    st.progress(job["progress"], text=label)
+
+
+def _drop_archive(zip_key):
+    st.session_state.pop(zip_key, None)
+
+
+def _download_outputs(job_id, outputs_dir, names=None, label="outputs", suffix=""):
+    # Streamlit needs the whole payload up front, so the archive is only built on request
+    # (in memory, streamed from the output files), capped in size, and dropped once downloaded
+    size = sum(
+        entry.stat().st_size for entry in os.scandir(outputs_dir)
+        if entry.is_file() and (names is None or entry.name in names)
+    ) if os.path.isdir(outputs_dir) else 0
+    if size > DOWNLOAD_MAX_BYTES:
+        st.warning(f"⚠️ The {label} take {size / 1e9:.1f} GB, too much to download from the browser. "
+                   f"Run the split with `python cli.py split` to write them to disk instead.")
+        return
+
+    zip_key = f"outputs_zip_{job_id}{suffix}"
+    if zip_key not in st.session_state and st.button(f"📦 Prepare {label} download", key=f"prepare_{job_id}{suffix}"):
+        for key in [key for key in st.session_state if str(key).startswith("outputs_zip_")]:
+            del st.session_state[key]
+        st.session_state[zip_key] = b"".join(workspace_utils.iter_zip(outputs_dir, names))
+
+    if zip_key in st.session_state:
+        st.download_button(f"⬇️ Download {label} (ZIP)", st.session_state[zip_key], file_name=f"{label.replace(' ', '_')}.zip",
+                           mime="application/zip", key=f"download_{job_id}{suffix}", on_click=_drop_archive, args=(zip_key,))
+
+
+def _show_bootstrap_summary(job_id, result, outputs_dir):
+    """How much the replicates differ, and a download of the most representative one alone."""
+    bootstrap = result["bootstrap"]
+    representative = bootstrap["representative"]
+
+    with st.expander("📊 Bootstrap summary"):
+        st.write(f"Replicate **{representative}** is the most representative "
+                 f"(mean distance to the average replicate: {bootstrap['scores'][representative - 1]:.4f}).")
+        if os.path.exists(bootstrap["variance"]):
+            st.caption("Standard deviation of value shares across replicates, in percentage points")
+            st.dataframe(pd.read_csv(bootstrap["variance"]).head(100), hide_index=True, use_container_width=True)
+
+    names = [os.path.basename(path) for path in result["outputs"] if f"_batch_{representative}." in os.path.basename(path)]
+    if names:
+        _download_outputs(job_id, outputs_dir, names, label=f"replicate {representative}", suffix="_representative")
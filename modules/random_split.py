@@ -1,9 +1,47 @@
 import streamlit as st
-from utils import split_utils, files_utils
+from utils import files_utils, preview_utils, queue_utils, workspace_utils
+from modules.job_status import show_job_status, split_job_running
 from streamlit_vertical_slider import vertical_slider
-import random
 import pandas as pd
 
+
+@st.cache_data(max_entries=8)
+def preview_sample(file_hash, _data):
+    """Fixed-size sample of the dataset, drawn once per dataset."""
+    return preview_utils.sample_rows(_data)
+
+
+@st.cache_data(max_entries=8)
+def column_summary(file_hash, _data):
+    """Summary statistics of every column, computed once per dataset."""
+    return preview_utils.column_summary(_data)
+
+
+@st.fragment
+def show_preview(data, file_hash):
+    """
+    Preview of a sample or a page of the dataset, restricted to the selected columns.
+    Runs as a fragment, so browsing the preview doesn't rerun the rest of the tab.
+    """
+    all_columns = list(data.columns)
+    columns = st.multiselect("Columns", all_columns, default=all_columns[:preview_utils.PREVIEW_COLUMNS],
+                             key=f"preview_columns_{file_hash}") or all_columns[:preview_utils.PREVIEW_COLUMNS]
+
+    mode = st.radio("Rows", ["Sample", "Pages"], horizontal=True, key="preview_mode", label_visibility="collapsed")
+    if mode == "Sample":
+        st.caption(f"Random sample of {min(len(data), preview_utils.PREVIEW_ROWS):,} of {len(data):,} rows")
+        st.dataframe(preview_sample(file_hash, data)[columns])
+    else:
+        page_size_col, page_col = st.columns(2)
+        page_size = page_size_col.selectbox("Rows per page", [50, 100, 500], index=1, key="preview_page_size")
+        n_pages = max(1, -(-len(data) // page_size))
+        page = page_col.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, key=f"preview_page_{file_hash}_{page_size}")
+        st.dataframe(preview_utils.page_of_rows(data, page, page_size, columns)[0])
+
+    with st.expander("Column summary"):
+        st.dataframe(column_summary(file_hash, data), hide_index=True, use_container_width=True)
+
+
 def app():
     data = st.session_state.get("data", pd.DataFrame())
     meta = st.session_state.get("meta", {})
@@ -70,39 +108,33 @@ def app():
 
         if st.session_state["boostrap"]:
             st.session_state["boostrap_occurences"] = st.number_input(
-                "Boostrap Occurences", min_value=0, max_value=10, value=st.session_state["boostrap_occurences"]
+                "Boostrap Occurences", min_value=1, max_value=200, value=st.session_state["boostrap_occurences"]
             )
 
+        stratify = st.multiselect("Stratify by", list(data.columns), key="stratify_random")
+
     with col_preview:
         st.write("### Preview:")
-        st.write("")
-        st.write("")
-        st.dataframe(data)
-
-    if st.button("Split Data"):
-        files_utils.empty_folder("outputs")
-
-        # Generate multiple random states if bootstrapping is enabled, otherwise set to None
-        random_states = [random.randint(1, 100) for _ in range(st.session_state["boostrap_occurences"])] if st.session_state["boostrap"] else None
-
-        # Perform dataset splitting
-        split_results = split_utils.random_split(
-            st.session_state["data"], 
-            train_size=train_size_percentage / 100, 
-            baseline=st.session_state["with_baseline"], 
-            remove_baseline=st.session_state["remove_baseline_from_holdout"], 
-            random_states=random_states
-        )
-
-        # Save results for each split (single or multiple depending on bootstrapping)
-        for idx, (train_df, holdout_df, baseline_df) in enumerate(split_results):
-            suffix = f"_batch_{idx+1}" if st.session_state["boostrap"] else ""
-            
-            files_utils.save_file(df=train_df, metadata=meta, file_path=f"outputs/train_{train_size}{suffix}" + "." +  st.session_state["file_type"])
-            files_utils.save_file(df=holdout_df, metadata=meta, file_path=f"outputs/holdout_{holdout_size}{suffix}" + "." + st.session_state["file_type"])
-
-            if st.session_state["with_baseline"]:
-                files_utils.save_file(df=baseline_df, metadata=meta, file_path=f"outputs/baseline_{train_size*2}{suffix}" + "." + st.session_state["file_type"])
-
-        st.success("Data has been successfully split!")
-
+        show_preview(data, st.session_state.get("file_hash"))
+
+    # The outputs folder is emptied for each split, so a new one waits for the running one to finish
+    running = split_job_running()
+    if st.button("Split Data", disabled=running, help="A split is still running." if running else None):
+        outputs_dir = workspace_utils.workspace_path(st.session_state["workspace"], "outputs")
+        files_utils.empty_folder(outputs_dir)
+
+        # Run the split in a background worker; the status below polls it
+        st.session_state["random_split_job"] = queue_utils.submit(st.session_state["file_path"], {
+            "mode": "random",
+            "train_size": train_size_percentage / 100,
+            "baseline": st.session_state["with_baseline"],
+            "remove_baseline": st.session_state["remove_baseline_from_holdout"],
+            "bootstrap": st.session_state["boostrap_occurences"] if st.session_state["boostrap"] else 1,
+            "stratify": stratify,
+            "output_dir": outputs_dir,
+            "file_type": st.session_state["output_type"],
+            "output_format": st.session_state["output_format"],
+            "sheet": st.session_state.get("sheet"),
+        })
+
+    show_job_status("random_split_job", workspace_utils.workspace_path(st.session_state["workspace"], "outputs"))
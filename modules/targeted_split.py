@@ -1,10 +1,53 @@
 import streamlit as st
 import pandas as pd
 from streamlit_vertical_slider import vertical_slider
-from utils import split_utils, files_utils
-import random
+from utils import split_utils, files_utils, filter_utils, queue_utils, workspace_utils
+from modules.job_status import show_job_status, split_job_running
 import json
 
+
+@st.cache_resource(max_entries=4)
+def get_segment_index(file_hash, _data):
+    """Builds one SegmentIndex per dataset, reused across reruns."""
+    return filter_utils.SegmentIndex(_data)
+
+
+@st.cache_data(max_entries=512)
+def segment_count(file_hash, filters, _index):
+    """Number of rows in the segment, cached per (dataset, filter set)."""
+    return _index.count(filters)
+
+
+@st.cache_data(max_entries=512)
+def split_preview(file_hash, filters, train_size_percentage, with_baseline, remove_baseline, _index):
+    """
+    Preview sizes of a targeted split, cached per (dataset, filter set, train percentage, baseline flags).
+    Least recently used entries are evicted first.
+    """
+    segment_size = segment_count(file_hash, filters, _index)
+    segment_training_size = round(segment_size * train_size_percentage / 100)
+    holdout_size = segment_size - 2 * segment_training_size if remove_baseline else segment_size - segment_training_size
+
+    return {
+        "segment_size": segment_size,
+        "segment_training_size": segment_training_size,
+        "total_training_size": segment_training_size + _index.n_rows - segment_size,
+        "holdout_size": holdout_size,
+        "baseline_size": segment_training_size * 2 if with_baseline else 0,
+    }
+
+
+@st.cache_data(max_entries=128)
+def training_holdout_chart(total_training_size, holdout_size, segment_training_size):
+    """Rendered donut chart as PNG bytes, so unchanged sizes don't redraw with matplotlib."""
+    return split_utils.training_holdout_png(total_training_size, holdout_size, segment_training_size)
+
+
+def sync_toggle(state_key, widget_key):
+    """Copies a toggle's new value into the shared session state key."""
+    st.session_state[state_key] = st.session_state[widget_key]
+
+
 def app():
     """Streamlit App for Dataset Splitting and Filtering"""
     data = st.session_state.get("data", pd.DataFrame())
@@ -39,7 +82,7 @@ def app():
         st.session_state.selections = []  
         st.session_state.user_choices = []
         for key in list(st.session_state.keys()):
-            if key.startswith("column_") or key.startswith("values_"):
+            if key.startswith(("column_", "values_", "negate_")):
                 del st.session_state[key]  
 
     dataset_summary, plot = st.columns([4, 2.5]) 
@@ -75,7 +118,8 @@ def app():
                 @st.cache_data
                 def get_unique_values(column):
                     """Returns unique non-null values from the specified column as a list."""
-                    return list(data[column].dropna().unique()) 
+                    # tolist() gives plain Python values, which the job queue can serialize
+                    return data[column].dropna().unique().tolist()
 
                 unique_values = get_unique_values(selected_column)
 
@@ -92,6 +136,7 @@ def app():
 
                 selected_values = [value_map[val] for val in selected_display_values]
                 st.session_state.selections[idx]["values"] = selected_values  # Store values in selections
+                st.session_state.selections[idx]["negate"] = st.checkbox("Exclude these values", key=f"negate_{idx}")
 
         st.button("❌ Clear All Filters", on_click=clear_selections)
 
@@ -110,57 +155,47 @@ def app():
         st.write("### ")
         st.write("### ")
 
-        # Update session state directly
-        if st.toggle("Baseline", value=st.session_state["with_baseline"], key="with_baseline_targeted"):
-            if not st.session_state["with_baseline"]:  
-                st.session_state["with_baseline"] = True
-                st.rerun()
-        else:
-            if st.session_state["with_baseline"]:
-                st.session_state["with_baseline"] = False
-                st.rerun()
-
-
-        if st.toggle("Remove Baseline from Holdout", 
-                    value=st.session_state["remove_baseline"], 
-                    key="remove_baseline_targeted", 
-                    disabled=not st.session_state["with_baseline"]):
-            if not st.session_state["remove_baseline"]:
-                st.session_state["remove_baseline"] = True
-                st.rerun()
-        else:
-            if st.session_state["remove_baseline"]:
-                st.session_state["remove_baseline"] = False
-                st.rerun()
+        # Toggles write straight to session state through callbacks, so a change costs a single rerun
+        st.toggle("Baseline", value=st.session_state["with_baseline"], key="with_baseline_targeted",
+                  on_change=sync_toggle, args=("with_baseline", "with_baseline_targeted"))
 
+        st.toggle("Remove Baseline from Holdout", 
+                  value=st.session_state["remove_baseline"], 
+                  key="remove_baseline_targeted", 
+                  disabled=not st.session_state["with_baseline"],
+                  on_change=sync_toggle, args=("remove_baseline", "remove_baseline_targeted"))
 
         # Bootstrap setting
-        new_boostrap_state = st.toggle(
-            "Boostrap", value=st.session_state["boostrap"], key="bootstrap_targeted"
-        )
-
-        if new_boostrap_state != st.session_state["boostrap"]:
-            st.session_state["boostrap"] = new_boostrap_state
-            st.rerun()  # Ensures UI updates immediately
+        st.toggle("Boostrap", value=st.session_state["boostrap"], key="bootstrap_targeted",
+                  on_change=sync_toggle, args=("boostrap", "bootstrap_targeted"))
 
         if st.session_state["boostrap"]:
             st.session_state["boostrap_occurences"] = st.number_input(
                 "Boostrap Occurrences", 
-                min_value=0, max_value=10, 
+                min_value=1, max_value=200, 
                 value=st.session_state["boostrap_occurences"], 
                 key="bootstrap_targeted_occurences"
             )
 
 
+        stratify = st.multiselect("Stratify by", list(data.columns), key="stratify_targeted")
+
+
     current_filters = {s["column"]: s["values"] for s in st.session_state.selections if s["values"]}
     st.session_state.user_choices = [current_filters] if current_filters else []
 
+    # Columns without selected values don't restrict the segment
+    active_filters = [s for s in st.session_state.selections if s["values"]]
 
-    filtered_df, remaining_df = split_utils.filter_dataframe(data, st.session_state.user_choices)
-
-    segment_training_size = round(filtered_df.shape[0] * train_size_percentage / 100)
-    total_training_size = segment_training_size + remaining_df.shape[0]
-    holdout_size = filtered_df.shape[0] - segment_training_size if not st.session_state["remove_baseline"] else filtered_df.shape[0] - 2*segment_training_size
+    segment_index = get_segment_index(st.session_state.get("file_hash"), data)
+    preview = split_preview(
+        st.session_state.get("file_hash"), active_filters, train_size_percentage,
+        st.session_state["with_baseline"], st.session_state["remove_baseline"], segment_index
+    )
+    segment_size = preview["segment_size"]
+    segment_training_size = preview["segment_training_size"]
+    total_training_size = preview["total_training_size"]
+    holdout_size = preview["holdout_size"]
 
     with dataset_summary:
         st.write("### Dataset Summary:")
@@ -178,8 +213,8 @@ def app():
 
         with row1[2]:
             tile = st.container(height=120)
-            segment_percentage = round(filtered_df.shape[0] * 100 / data.shape[0], 2)
-            tile.metric(label="Segment Size", value=f"{filtered_df.shape[0]}", delta=f"{segment_percentage}%")
+            segment_percentage = round(segment_size * 100 / data.shape[0], 2)
+            tile.metric(label="Segment Size", value=f"{segment_size}", delta=f"{segment_percentage}%")
 
         with row2[0]:
             tile = st.container(height=120)
@@ -199,44 +234,36 @@ def app():
         if st.session_state["with_baseline"]:
             with row2[3]:
                 tile = st.container(height=120)
-                baseline_size = segment_training_size * 2
+                baseline_size = preview["baseline_size"]
                 baseline_percentage = round(baseline_size * 100 / data.shape[0], 2)
                 tile.metric(label="Baseline Size", value=f"{baseline_size}", delta=f"{baseline_percentage}%")
 
     with plot:
-        split_utils.plot_training_holdout(
-            total_training_size=total_training_size, 
-            holdout_size=holdout_size, 
-            segment_training_size=segment_training_size
-        )
+        st.image(training_holdout_chart(total_training_size, holdout_size, segment_training_size), use_container_width=True)
 
     split_row = st.columns(3)
 
     with split_row[1]:
-        if st.button("Split Data", key="targeted_split_button", use_container_width=True, type="primary"):
-            files_utils.empty_folder("outputs")
-
-            # Generate multiple random states if bootstrapping is enabled, otherwise set to None
-            random_states = [random.randint(1, 100) for _ in range(st.session_state["boostrap_occurences"])] if st.session_state["boostrap"] else None
-
-            # Perform dataset splitting
-            split_results = split_utils.targeted_split(
-                st.session_state["data"], 
-                train_size=train_size_percentage / 100, 
-                baseline=st.session_state["with_baseline"], 
-                remove_baseline=st.session_state["remove_baseline"], 
-                random_states=random_states,
-                filters=st.session_state["selections"]
-            )
-
-            # Save results for each split (single or multiple depending on bootstrapping)
-            for idx, (train_df, holdout_df, baseline_df) in enumerate(split_results):
-                suffix = f"_batch_{idx+1}" if st.session_state["boostrap"] else ""
-
-                files_utils.save_file(df=train_df, metadata=meta, file_path=f"outputs/train_{total_training_size}{suffix}" + "." + st.session_state["file_type"])
-                files_utils.save_file(df=holdout_df, metadata=meta, file_path=f"outputs/holdout_{holdout_size}{suffix}" + "." + st.session_state["file_type"])
-
-                if st.session_state["with_baseline"]:
-                    files_utils.save_file(df=baseline_df, metadata=meta, file_path=f"outputs/baseline_{baseline_size}{suffix}" + "." + st.session_state["file_type"])
-
-            st.success("Data has been successfully split!")
\ No newline at end of file
+        # The outputs folder is emptied for each split, so a new one waits for the running one to finish
+        running = split_job_running()
+        if st.button("Split Data", key="targeted_split_button", use_container_width=True, type="primary",
+                     disabled=running, help="A split is still running." if running else None):
+            outputs_dir = workspace_utils.workspace_path(st.session_state["workspace"], "outputs")
+            files_utils.empty_folder(outputs_dir)
+
+            # Run the split in a background worker; the status below polls it
+            st.session_state["targeted_split_job"] = queue_utils.submit(st.session_state["file_path"], {
+                "mode": "targeted",
+                "filters": active_filters,
+                "train_size": train_size_percentage / 100,
+                "baseline": st.session_state["with_baseline"],
+                "remove_baseline": st.session_state["remove_baseline"],
+                "bootstrap": st.session_state["boostrap_occurences"] if st.session_state["boostrap"] else 1,
+                "stratify": stratify,
+                "output_dir": outputs_dir,
+                "file_type": st.session_state["output_type"],
+                "output_format": st.session_state["output_format"],
+                "sheet": st.session_state.get("sheet"),
+            })
+
+    show_job_status("targeted_split_job", workspace_utils.workspace_path(st.session_state["workspace"], "outputs"))
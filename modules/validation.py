@@ -1,10 +1,28 @@
 import streamlit as st
 import pandas as pd
-from utils import files_utils
+from utils import files_utils, validation_utils, workspace_utils
 import numpy as np
 import plotly.graph_objects as go
 
 
+@st.cache_data(max_entries=8)
+def dataset_profile(file_hash, _data):
+    """Frequency profile of a dataset, computed once per file content."""
+    return validation_utils.frequency_profile(_data)
+
+
+@st.cache_data(max_entries=16)
+def compare_to_reference(reference_hash, candidate_hash, _reference, _candidate):
+    """
+    Comparison and drift scores of a candidate against the reference dataset.
+    The reference profile is cached, so comparing several candidates only profiles the candidates.
+    """
+    comparison = validation_utils.compare_profiles(
+        dataset_profile(reference_hash, _reference), dataset_profile(candidate_hash, _candidate)
+    )
+    return comparison, validation_utils.drift_scores(comparison)
+
+
 def compare_dataframes_pivot(df1, df2):
     """
     Compare two DataFrames in a structured pivot format with percentages using Plotly Table.
@@ -12,42 +30,33 @@ def compare_dataframes_pivot(df1, df2):
     """
 
     # Find common columns
-    common_columns = list(set(df1.columns) & set(df2.columns))
-    if not common_columns:
+    if not set(df1.columns) & set(df2.columns):
         st.sidebar.error("❌ No common columns found!")
         return None
 
-    # Lists to store table content
-    column_labels = []
-    values_col = []
-    df1_percent = []
-    df2_percent = []
-
-    for col in common_columns:
-        # Compute percentages
-        df1_counts = df1[col].value_counts(normalize=True) * 100
-        df2_counts = df2[col].value_counts(normalize=True) * 100
-
-        # Merge counts
-        merged_counts = pd.merge(df1_counts.rename("df1 (%)"),
-                                 df2_counts.rename("df2 (%)"),
-                                 left_index=True, right_index=True, how="outer").fillna(0)
-
-        # Round values
-        merged_counts = merged_counts.round(2)
-
-        # Append column header row (for grouping)
-        column_labels.append(f"{col}")
-        values_col.append("")
-        df1_percent.append("")
-        df2_percent.append("")
-
-        # Append each value with percentages
-        for value, row in merged_counts.iterrows():
-            column_labels.append("")  # Keep the column header above
-            values_col.append(str(value))
-            df1_percent.append(f"{row['df1 (%)']}%")
-            df2_percent.append(f"{row['df2 (%)']}%")
+    comparison = validation_utils.compare_frequencies(df1, df2)
+    return comparison_table(validation_utils.subset_columns(comparison, pd.unique(comparison["column"])))
+
+
+def comparison_table(comparison):
+    """Plotly table of a comparison frame, with a header row above each column's values."""
+    # Interleave one header row per column (for grouping) with its value rows
+    headers = pd.DataFrame({"column": pd.unique(comparison["column"])})
+    headers["_order"] = np.arange(len(headers))
+    values = comparison.assign(_order=comparison["column"].map(dict(zip(headers["column"], headers["_order"]))))
+    table = pd.concat([
+        headers.assign(_is_value=0, label=headers["column"].astype(str), value="", df1="", df2=""),
+        values.assign(
+            _is_value=1, label="", value=values["value"].astype(str),
+            df1=values["df1 (%)"].round(2).astype(str) + "%",
+            df2=values["df2 (%)"].round(2).astype(str) + "%",
+        ),
+    ]).sort_values(["_order", "_is_value"], kind="stable")
+
+    column_labels = table["label"].tolist()
+    values_col = table["value"].tolist()
+    df1_percent = table["df1"].tolist()
+    df2_percent = table["df2"].tolist()
 
     # Create Plotly Table with full-width layout
     fig = go.Figure(data=[go.Table(
@@ -72,40 +81,83 @@ def compare_dataframes_pivot(df1, df2):
     return fig
 
 
+def show_comparison_page(comparison, scores):
+    """
+    Shows one page of columns at a time, each with at most MAX_VALUES_PER_COLUMN value rows,
+    so the browser payload stays bounded however wide or long the dataset is. Search and sorting run server-side.
+    """
+    search_col, sort_col, size_col, page_col = st.columns([4, 2, 1, 1])
+
+    with search_col:
+        search = st.text_input("Search columns", key="validation_search")
+    with sort_col:
+        sort_by = st.selectbox("Sort by", ["Drift score", "Column name"], key="validation_sort")
+    with size_col:
+        page_size = st.selectbox("Columns per page", [10, 25, 50, 100], index=1, key="validation_page_size")
+
+    _, n_pages = validation_utils.page_of_columns(scores, search, page_size=page_size)
+    with page_col:
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key="validation_page")
+
+    page_scores, _ = validation_utils.page_of_columns(
+        scores, search, sort_by="name" if sort_by == "Column name" else "drift", page=page, page_size=page_size
+    )
+
+    st.write("### Drift by column")
+    st.dataframe(page_scores, hide_index=True, use_container_width=True)
+
+    # Display table in Streamlit
+    st.write("### Tri croisé avec proportions (%)")
+    page_comparison = validation_utils.subset_columns(comparison, page_scores["column"].tolist())
+    st.plotly_chart(comparison_table(page_comparison), use_container_width=True)
+    st.caption(f"Columns with more than {validation_utils.MAX_VALUES_PER_COLUMN} values show their most frequent ones "
+               "and group the rest under \"Other\".")
+
+
 def app():
     st.write("### Validation Process")
 
     # File upload
     uploaded_file = st.file_uploader(
         "Drag & Drop or Click to Upload",
-        type=["csv", "xlsx", "sav"],
+        type=["csv", "xlsx", "sav", "zsav"],
         key="fairset_uploader"
     )
 
     if uploaded_file:
         try:
-            # Save and load the file
-            fairset_path = files_utils.save_uploaded_file(uploaded_file)
-            fairset, fairset_meta = files_utils.load_file(fairset_path)
-
-            if fairset is not None:
-                # Store in session_state
-                st.session_state["fairset"] = fairset
-                st.session_state["fairset_meta"] = fairset_meta
-                st.session_state["fairset_path"] = fairset_path
-                file_type = fairset_path.split(".")[-1]
-                st.session_state["fairset_type"] = file_type
+            # Load the file straight from the upload buffer, once per upload
+            if st.session_state.get("fairset_upload_id") != uploaded_file.file_id:
+                fairset, fairset_meta, fairset_hash, fairset_path = files_utils.load_uploaded_file(
+                    uploaded_file, folder=workspace_utils.workspace_path(st.session_state["workspace"], "uploads"),
+                    optimize=st.session_state.get("optimize_dtypes", False)
+                )
+
+                if fairset is not None:
+                    # Store in session_state
+                    st.session_state["fairset"] = fairset
+                    st.session_state["fairset_meta"] = fairset_meta
+                    st.session_state["fairset_path"] = fairset_path
+                    st.session_state["fairset_hash"] = fairset_hash
+                    st.session_state["fairset_type"] = uploaded_file.name.rsplit(".", 1)[-1].lower()
+                    st.session_state["fairset_upload_id"] = uploaded_file.file_id
+
+            if st.session_state.get("fairset_upload_id") == uploaded_file.file_id:
+                fairset = st.session_state["fairset"]
+                fairset_hash = st.session_state["fairset_hash"]
+                file_type = st.session_state["fairset_type"]
                 
                 st.sidebar.success(f"✅ {file_type.upper()} file successfully loaded!")
 
                 # Ensure comparison is done with stored data
                 if "data" in st.session_state:
-                    # Generate Plotly table
-                    fig = compare_dataframes_pivot(st.session_state["data"], fairset)
+                    data = st.session_state["data"]
+                    if not set(data.columns) & set(fairset.columns):
+                        st.sidebar.error("❌ No common columns found!")
+                        return
 
-                    # Display table in Streamlit
-                    st.write("### Tri croisé avec proportions (%)")
-                    st.plotly_chart(fig, use_container_width=True)
+                    comparison, scores = compare_to_reference(st.session_state["file_hash"], fairset_hash, data, fairset)
+                    show_comparison_page(comparison, scores)
                 else:
                     st.sidebar.error("❌ 'data' not found in session_state.")
                     
@@ -0,0 +1,317 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from utils import bootstrap_utils, files_utils, filter_utils, manifest_utils, split_utils
+
+
+DEFAULT_SPEC = {
+    "mode": "random",  # "random" or "targeted"
+    "train_size": 0.1,
+    "baseline": True,
+    "remove_baseline": True,
+    "bootstrap": 1,  # Number of replicates
+    "export_replicates": "all",  # "all", or "representative" to only write the most representative replicate
+    "seed": None,
+    "filters": [],
+    "stratify": [],
+    "streaming": False,  # Split CSV/SAV files without loading them whole
+    "sheet": None,  # Workbook sheet to split; defaults to the first one
+    "optimize_dtypes": True,  # Hold the dataset in compact dtypes; outputs keep the original ones
+    "output_dir": "outputs",
+    "file_type": None,  # Output format; defaults to the dataset's extension
+    "output_format": "files",  # "files", or "manifest" to only record the assignments (see manifest_utils)
+    "incremental": False,  # Record row ids in the manifest so later waves can be split with run_incremental
+    "row_key": None,  # Column identifying rows across waves (implies incremental); defaults to the whole row
+}
+
+
+def load_spec(spec):
+    """
+    Normalizes a split spec given as a dict, a JSON file path, or a user_selections.json-style
+    list of {column: values} filters (which implies a targeted split with default settings).
+    """
+    if isinstance(spec, str):
+        with open(spec) as f:
+            spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {"mode": "targeted", "filters": spec}
+
+    spec = {**DEFAULT_SPEC, **spec}
+    if spec["mode"] not in ("random", "targeted"):
+        raise ValueError(f"Unknown split mode: {spec['mode']}")
+    if spec["export_replicates"] not in ("all", "representative"):
+        raise ValueError(f"Unknown export_replicates: {spec['export_replicates']}")
+    if spec["output_format"] not in ("files", "manifest"):
+        raise ValueError(f"Unknown output_format: {spec['output_format']}")
+
+    # Filters may use either the condition format or the {column: values} format
+    filters = spec["filters"] or []
+    if any("column" not in f and "any" not in f for f in filters):
+        filters = filter_utils.conditions_from_dicts(filters)
+    spec["filters"] = filters
+
+    if spec["seed"] is None:
+        spec["seed"] = np.random.SeedSequence().entropy  # Recorded so the run can be reproduced
+    return spec
+
+
+def run_split(dataset, spec, export_workers=None, progress=None):
+    """
+    Runs one random or targeted split (with bootstrap replicates) of a dataset and exports the outputs.
+    Returns a JSON-serializable summary with the seed used, the written files and any errors.
+    """
+    spec = load_spec(spec)
+    try:
+        return _run_split(dataset, spec, export_workers, progress)
+    except Exception as e:
+        return {"dataset": dataset, "seed": spec["seed"], "outputs": [], "errors": {dataset: str(e)}}
+
+
+def _run_split(dataset, spec, export_workers, progress):
+    os.makedirs(spec["output_dir"], exist_ok=True)
+
+    filters = spec["filters"] if spec["mode"] == "targeted" else None
+    n_replicates = max(1, int(spec["bootstrap"]))
+    file_type = spec["file_type"] or dataset.rsplit(".", 1)[-1].lower()
+    manifest_path = os.path.join(spec["output_dir"], manifest_utils.MANIFEST_NAME)
+    bootstrap = None
+
+    if spec["streaming"]:
+        labels, meta = split_utils.file_labels(
+            dataset, n_replicates, filters=filters, train_size=spec["train_size"], baseline=spec["baseline"],
+            remove_baseline=spec["remove_baseline"], seed=spec["seed"], stratify=spec["stratify"] or None
+        )
+        # Hashing whole rows would mean reading the file twice, so streamed splits only record keyed row ids
+        row_ids = None
+        if spec["row_key"]:
+            keys, _ = files_utils.load_columns(dataset, [spec["row_key"]])
+            row_ids = manifest_utils.row_ids(keys, spec["row_key"])
+        # The manifest is always written, so the split can be extended when the dataset grows
+        manifest_utils.write_manifest(manifest_path, labels, files_utils.file_hash(dataset), spec,
+                                      row_ids=row_ids, file_type=file_type)
+
+        if spec["output_format"] == "manifest":
+            outputs, errors = [manifest_path], {}
+        else:
+            jobs = split_utils.output_jobs(labels, spec["output_dir"], file_type, has_baseline=spec["baseline"],
+                                           bootstrap=n_replicates > 1)
+            errors = files_utils.stream_export(dataset, jobs, metadata=meta)
+            outputs = [path for path, _ in jobs]
+    else:
+        df, meta, content_hash = files_utils.load_file_cached(dataset, optimize=spec["optimize_dtypes"], sheet_name=spec["sheet"])
+        if df is None:
+            return {"dataset": dataset, "seed": spec["seed"], "outputs": [], "errors": {dataset: "Could not load file"}}
+
+        labels = split_utils.bootstrap_split(
+            df, n_replicates, filters=filters, train_size=spec["train_size"], baseline=spec["baseline"],
+            remove_baseline=spec["remove_baseline"], seed=spec["seed"], stratify=spec["stratify"] or None
+        )
+        replicates = None
+        if n_replicates > 1:
+            bootstrap = _summarize_bootstrap(df, labels, spec)
+            if spec["export_replicates"] == "representative":
+                replicates = [bootstrap["representative"]]
+
+        # Hashing every row costs far more than the split itself, so row ids are only recorded on request
+        row_ids = manifest_utils.row_ids(df, spec["row_key"]) if spec["incremental"] or spec["row_key"] else None
+        manifest_utils.write_manifest(manifest_path, labels, content_hash, spec, row_ids=row_ids, file_type=file_type,
+                                      sheet_id=files_utils.dataset_sheet_id(dataset, spec["sheet"]), bootstrap=bootstrap)
+        if spec["output_format"] == "manifest":
+            outputs, errors = [manifest_path], {}
+        else:
+            jobs = split_utils.output_jobs(labels, spec["output_dir"], file_type, has_baseline=spec["baseline"],
+                                           bootstrap=n_replicates > 1, replicates=replicates)
+            errors = files_utils.export_files(df, jobs, metadata=meta, max_workers=export_workers, progress=progress)
+            outputs = [path for path, _ in jobs]
+
+    result = {
+        "dataset": dataset,
+        "seed": spec["seed"],
+        "outputs": [path for path in outputs if path not in errors],
+        "errors": {path: error["error"] for path, error in errors.items()},
+    }
+    if bootstrap:
+        result["bootstrap"] = bootstrap
+    return result
+
+
+def run_incremental(dataset, manifest_path, progress=None):
+    """
+    Splits a new wave of a dataset against the manifest of its previous split (see _run_split).
+    Rows already in the manifest keep their assignment; only new rows are split, with the same spec
+    on a seed stream of their own (see manifest_utils.wave_seed). Their rows are appended to the existing
+    output files, which are renamed to their new row counts, and the manifest is replaced by one covering
+    the whole wave (the previous one is kept as manifest_wave_<n>.npz).
+    Rows missing from the new wave stay in the outputs but leave the manifest.
+    A bootstrap is scored again on the whole wave (see _summarize_bootstrap); when only the representative
+    replicate is exported and another one becomes the most representative, its files are written in full.
+    """
+    try:
+        return _run_incremental(dataset, manifest_path, progress)
+    except Exception as e:
+        return {"dataset": dataset, "manifest": manifest_path, "outputs": [], "errors": {dataset: str(e)}}
+
+
+def _run_incremental(dataset, manifest_path, progress):
+    previous_labels, info = manifest_utils.read_manifest(manifest_path)
+    previous_ids = manifest_utils.read_row_ids(manifest_path)
+    if previous_ids is None:
+        raise ValueError("The manifest has no row ids; split the dataset again with incremental or a row_key "
+                         "(a row_key when streaming) to record them")
+
+    spec = info["spec"]
+    output_dir = os.path.dirname(manifest_path)
+    wave = info.get("wave", 1) + 1
+    has_baseline = spec["baseline"]
+    n_replicates = info["n_replicates"]
+
+    sheet_id = files_utils.dataset_sheet_id(dataset, spec["sheet"])
+    if sheet_id != info.get("sheet_id"):
+        raise ValueError(f"{dataset} is not from the workbook sheet the previous split was made from")
+    df, meta, content_hash = files_utils.load_file_cached(dataset, optimize=spec["optimize_dtypes"], sheet_name=spec["sheet"])
+    if df is None:
+        raise ValueError(f"Could not load {dataset}")
+
+    ids = manifest_utils.row_ids(df, spec.get("row_key"))
+    matches = manifest_utils.match_rows(previous_ids, ids)
+    new_rows = np.flatnonzero(matches < 0)
+    kept = np.flatnonzero(matches >= 0)
+
+    # Only the new rows are split; earlier rows carry their labels over
+    delta_labels = split_utils.bootstrap_split(
+        df.iloc[new_rows], n_replicates, filters=spec["filters"] if spec["mode"] == "targeted" else None,
+        train_size=spec["train_size"], baseline=has_baseline, remove_baseline=spec["remove_baseline"],
+        seed=manifest_utils.wave_seed(spec["seed"], wave), stratify=spec["stratify"] or None
+    )
+    labels = np.zeros((n_replicates, len(df)), dtype=np.uint8)
+    labels[:, kept] = previous_labels[:, matches[kept]]
+    labels[:, new_rows] = delta_labels
+
+    # The variance and scores of the previous wave no longer describe the merged labels
+    bootstrap = info.get("bootstrap")
+    if bootstrap:
+        bootstrap = _summarize_bootstrap(df, labels, {**spec, "output_dir": output_dir})
+
+    outputs, errors = [], {}
+    file_type = info.get("file_type") or spec["file_type"] or dataset.rsplit(".", 1)[-1].lower()
+    replicates = range(1, n_replicates + 1)
+    if spec["output_format"] == "files" and spec["export_replicates"] == "representative" and bootstrap:
+        replicates = [info["bootstrap"]["representative"]]
+        if bootstrap["representative"] != replicates[0]:
+            # The new representative replicate has no files yet, so they are written whole
+            replicates = []
+            jobs = split_utils.output_jobs(labels, output_dir, file_type, has_baseline=has_baseline, bootstrap=True,
+                                           replicates=[bootstrap["representative"]])
+            errors = files_utils.export_files(df, jobs, metadata=meta, max_workers=1)
+            outputs = [path for path, _ in jobs]
+
+    if spec["output_format"] == "files" and len(new_rows) and replicates:
+        parts = ["train", "holdout", "baseline"] if has_baseline else ["train", "holdout"]
+
+        appends = []
+        for replicate in replicates:
+            previous_plan = split_utils.SplitPlan.from_labels(previous_labels[replicate - 1], has_baseline=has_baseline)
+            delta_plan = split_utils.SplitPlan.from_labels(delta_labels[replicate - 1], has_baseline=has_baseline)
+            number = replicate if n_replicates > 1 else None
+            for part in parts:
+                n_previous, rows = len(getattr(previous_plan, part)), new_rows[getattr(delta_plan, part)]
+                appends.append((
+                    os.path.join(output_dir, split_utils.output_name(part, n_previous, file_type, number)),
+                    os.path.join(output_dir, split_utils.output_name(part, n_previous + len(rows), file_type, number)),
+                    rows,
+                ))
+
+        for done, (path, new_path, rows) in enumerate(appends, start=1):
+            error = files_utils.append_file(df, path, rows, new_path, metadata=meta) if len(rows) else None
+            if error:
+                errors[new_path] = error
+            outputs.append(new_path)
+            if progress:
+                progress(done, len(appends), new_path)
+
+    # Files that failed can be rebuilt from the new manifest with manifest_utils.materialize
+    os.replace(manifest_path, os.path.join(output_dir, f"manifest_wave_{wave - 1}.npz"))
+    manifest_utils.write_manifest(manifest_path, labels, content_hash, spec, row_ids=ids, wave=wave, sheet_id=sheet_id,
+                                  file_type=info.get("file_type"), bootstrap=bootstrap)
+
+    result = {
+        "dataset": dataset,
+        "manifest": manifest_path,
+        "wave": wave,
+        "new_rows": len(new_rows),
+        "removed_rows": len(previous_ids) - len(kept),
+        "outputs": [path for path in outputs if path not in errors],
+        "errors": {path: error["error"] for path, error in errors.items()},
+    }
+    if bootstrap:
+        result["bootstrap"] = bootstrap
+    return result
+
+
+def _summarize_bootstrap(df, labels, spec):
+    """
+    Scores the replicates of a bootstrap and writes the variance of each column across them
+    to bootstrap_variance.csv next to the outputs.
+    """
+    _, variance, scores = bootstrap_utils.bootstrap_summary(df, labels, has_baseline=spec["baseline"], distributions=False)
+    variance_path = os.path.join(spec["output_dir"], "bootstrap_variance.csv")
+    variance.round(4).to_csv(variance_path, index=False)
+
+    return {
+        "representative": bootstrap_utils.representative_replicate(scores),
+        "scores": [round(float(score), 6) for score in scores],
+        "variance": variance_path,
+    }
+
+
+def _run_job(job):
+    # Parallelism is across datasets, so each job exports its own files sequentially
+    return run_split(job["dataset"], job["spec"], export_workers=1)
+
+
+def load_jobs(jobs_file):
+    """
+    Reads a job file: either a list of jobs or {"max_workers": n, "jobs": [...]}.
+    Each job is {"dataset": path, "spec": dict or spec file path}. Jobs without an
+    explicit output_dir write to outputs/<dataset name> so they don't clobber each other.
+    """
+    with open(jobs_file) as f:
+        content = json.load(f)
+    if isinstance(content, list):
+        content = {"jobs": content}
+
+    jobs = []
+    for job in content["jobs"]:
+        spec = job.get("spec", {})
+        if isinstance(spec, str):
+            with open(spec) as f:
+                spec = json.load(f)
+        if isinstance(spec, list):
+            spec = {"mode": "targeted", "filters": spec}
+
+        name = os.path.splitext(os.path.basename(job["dataset"]))[0]
+        spec = load_spec({"output_dir": os.path.join(DEFAULT_SPEC["output_dir"], name), **spec})
+        jobs.append({"dataset": job["dataset"], "spec": spec})
+
+    return jobs, content.get("max_workers")
+
+
+def run_jobs(jobs, max_workers=None):
+    """Runs many split jobs in parallel across processes, returning one summary per job in input order."""
+    max_workers = min(len(jobs), max_workers or os.cpu_count() or 1) if jobs else 1
+    if max_workers == 1:
+        return [_run_job(job) for job in jobs]
+
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # The worker process itself failed (e.g. ran out of memory)
+                results[i] = {"dataset": jobs[i]["dataset"], "seed": jobs[i]["spec"]["seed"], "outputs": [], "errors": {jobs[i]["dataset"]: str(e)}}
+
+    return results
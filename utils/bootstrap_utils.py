@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from utils import split_utils
+
+
+MAX_SUMMARY_VALUES = 50  # Columns with more distinct values (ids, free text) are left out of the summary
+SUMMARY_BATCH_CELLS = 1 << 21  # Labels (replicates x rows) regrouped at once while counting
+PARTS = [("train", split_utils.TRAIN), ("holdout", split_utils.HOLDOUT), ("baseline", split_utils.BASELINE)]
+
+
+def replicate_counts(df: pd.DataFrame, labels: np.ndarray, has_baseline: bool = True, columns=None):
+    """
+    Value counts of every summarized column, for every replicate and part.
+    Yields (column, uniques, {part: (n_replicates x n_values) counts}).
+    Rows are sorted by value once per column, so each count is a sum over a contiguous run of the
+    replicate's membership flags; replicates are processed SUMMARY_BATCH_CELLS labels at a time, which
+    bounds memory whatever the number of replicates. Missing values are not counted, as in validation_utils.
+    """
+    parts = PARTS if has_baseline else PARTS[:2]
+    n_replicates, n_rows = labels.shape
+    batch = max(1, SUMMARY_BATCH_CELLS // max(n_rows, 1))
+
+    for column in (df.columns if columns is None else columns):
+        codes, uniques = pd.factorize(df[column], use_na_sentinel=True)
+        n_values = len(uniques)
+        if n_values == 0 or n_values > MAX_SUMMARY_VALUES:
+            continue
+
+        # Rows grouped by value; missing values (code -1) sort first and are left out
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        order = order[np.searchsorted(sorted_codes, 0):]
+        starts = np.searchsorted(sorted_codes[len(sorted_codes) - len(order):], np.arange(n_values))
+
+        part_counts = {name: np.zeros((n_replicates, n_values), dtype=np.int64) for name, _ in parts}
+        for first in range(0, n_replicates, batch):
+            grouped = labels[first:first + batch][:, order]
+            for name, flag in parts:
+                part_counts[name][first:first + batch] = np.add.reduceat(((grouped & flag) != 0).view(np.uint8), starts, axis=1, dtype=np.int32)
+
+        yield column, uniques, part_counts
+
+
+def _shares(counts):
+    totals = counts.sum(axis=-1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+
+def bootstrap_summary(df: pd.DataFrame, labels: np.ndarray, has_baseline: bool = True, columns=None,
+                      distributions: bool = True):
+    """
+    Compares the replicates of a bootstrap from their label matrix, without materializing any split.
+
+    Returns (distributions, variance, scores):
+    - distributions: tidy frame of (column, value, part, replicate, count, share) for every replicate and part,
+      or None when `distributions` is False (it has a row per value, part and replicate, so skip it when unused),
+    - variance: per (column, part), the mean and largest standard deviation of value shares across replicates
+      (in percentage points), most variable first,
+    - scores: per replicate, the mean total variation distance between each of its parts and the average
+      of that part over all replicates (the full dataset's distribution for a random split, the segment's
+      for a targeted one). The lowest score is the most representative replicate.
+    """
+    n_replicates = len(labels)
+    frames, variance = [], []
+    distance_sum = np.zeros(n_replicates)
+    n_distances = 0
+
+    for column, uniques, part_counts in replicate_counts(df, labels, has_baseline, columns):
+        values = np.asarray(uniques, dtype=object)
+
+        for part, counts in part_counts.items():
+            shares = _shares(counts)
+            if distributions:
+                frames.append(pd.DataFrame({
+                    "column": column,
+                    "part": part,
+                    "replicate": np.repeat(np.arange(1, n_replicates + 1), len(values)),
+                    "value": np.tile(values, n_replicates),
+                    "count": counts.ravel(),
+                    "share": shares.ravel(),
+                }))
+
+            std = shares.std(axis=0) * 100
+            variance.append({"column": column, "part": part, "mean_std": std.mean(), "max_std": std.max()})
+
+            distance_sum += 0.5 * np.abs(shares - shares.mean(axis=0)).sum(axis=1)
+            n_distances += 1
+
+    distribution_frame = None
+    if distributions:
+        distribution_frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=["column", "part", "replicate", "value", "count", "share"]
+        )
+    variance = pd.DataFrame(variance, columns=["column", "part", "mean_std", "max_std"])
+    variance = variance.sort_values("max_std", ascending=False, ignore_index=True)
+    scores = distance_sum / n_distances if n_distances else distance_sum
+
+    return distribution_frame, variance, scores
+
+
+def representative_replicate(scores: np.ndarray):
+    """1-based number of the most representative replicate (the _batch_<n> of its files)."""
+    return int(np.argmin(scores)) + 1
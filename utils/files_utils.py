@@ -1,15 +1,53 @@
 import os
+import hashlib
+import logging
+import pickle
+import tempfile
+import time
+import weakref
+import zipfile
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import openpyxl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
 import pyreadstat
+from utils import perf_utils
 
 
 UPLOAD_FOLDER = "uploads"
+CACHE_FOLDER = "cache"
+CACHE_MAX_BYTES = 20 << 30  # The cache is trimmed to this size, least recently used entries first
+CACHE_TTL = 7 * 24 * 3600  # Seconds since last use before a cache entry is deleted
+CSV_CHUNK_ROWS = 100_000  # Rows written per chunk when streaming CSVs
+CATEGORY_MAX_RATIO = 0.5  # Text columns become categorical when at most this share of their values are distinct
+INT_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+SAV_EXTENSIONS = (".sav", ".zsav")  # .zsav is the compressed variant, read and written by the same calls
+SAV_MEASURES = {"nominal", "ordinal", "scale"}
+EXCEL_STREAM_ROWS = 50_000  # Sheets with more rows are streamed row by row instead of read by pandas
+SAV_PROGRESS_ROWS = 100_000  # SAV uploads with more rows are parsed in chunks to report progress
+SAV_PROGRESS_CHUNKS = 10  # Each chunk re-opens the file, so there are only a few of them
+XLSX_NAMESPACE = {"main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(CACHE_FOLDER, exist_ok=True)
 
+# (path, size, mtime) -> content hash, so unchanged files are not re-hashed on every rerun
+_hash_memo = {}
 
-def save_uploaded_file(uploaded_file):
-    """Saves uploaded file to the uploads folder."""
-    file_path = os.path.join(UPLOAD_FOLDER, uploaded_file.name)
+# pyreadstat metadata object -> {"all": write_sav options, column tuple: options pruned to those columns}
+_sav_options = weakref.WeakKeyDictionary()
+
+
+class LoadCancelled(Exception):
+    """Raised by a progress callback to stop a load nobody waits for anymore (see ingest_utils)."""
+
+
+def save_uploaded_file(uploaded_file, folder=UPLOAD_FOLDER):
+    """Saves uploaded file to the uploads folder (or a session's own upload folder)."""
+    file_path = os.path.join(folder, uploaded_file.name)
     
     with open(file_path, "wb") as f:
         f.write(uploaded_file.getbuffer())
@@ -17,68 +55,779 @@ def save_uploaded_file(uploaded_file):
     return file_path
 
 
-def load_file(file_path):
-    """Loads CSV, XLSX, or SAV files into a Pandas DataFrame."""
+def load_file(file_path, optimize=False, sheet_name=None):
+    """
+    Loads CSV, XLSX, or SAV files into a Pandas DataFrame.
+    Workbooks load one sheet: sheet_name, or the first one (see list_sheets).
+    With optimize, columns are downcast to compact dtypes (see optimize_dtypes).
+    """
     file_name = file_path.lower()
     meta = None
     try:
-        if file_name.endswith(".csv"):
-            print(file_path)
-            df = pd.read_csv(file_path)
+        with perf_utils.stage("load", file=os.path.basename(file_path)) as record:
+            if file_name.endswith(".csv"):
+                df = pd.read_csv(file_path)
+
+            elif file_name.endswith(".xlsx"):
+                df = read_sheet(file_path, sheet_name)
+
+            elif file_name.endswith(SAV_EXTENSIONS):
+                df, meta = pyreadstat.read_sav(file_path)
+
+            else:
+                return None, {"error": "Unsupported file type"}
+
+            record["rows"] = len(df) if isinstance(df, pd.DataFrame) else None
+        if optimize and isinstance(df, pd.DataFrame):
+            df = optimize_dtypes(df, meta)
+        return df, meta
+
+    except Exception as e:
+        perf_utils.log("load_failed", logging.ERROR, file=file_path, error=str(e))
+        return
+
+
+def list_sheets(source):
+    """
+    Names of the sheets of an .xlsx workbook (a path or file object), in workbook order.
+    Only the workbook's index is read, so this is instant whatever the size of the sheets.
+    """
+    with zipfile.ZipFile(source) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    return [sheet.get("name") for sheet in workbook.find("main:sheets", XLSX_NAMESPACE)]
 
-        elif file_name.endswith(".xlsx"):
-            print(file_path)
-            print(meta)
 
-            df = pd.read_excel(file_path, sheet_name=None)
+def read_sheet(source, sheet_name=None, progress=None):
+    """
+    Loads one sheet of an .xlsx workbook (the first one by default) without parsing the others.
+    Sheets over EXCEL_STREAM_ROWS rows are streamed from a read-only workbook in blocks of rows,
+    so the whole sheet is never held as Python cells at once; progress(fraction) is called after each block.
+    """
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        if (sheet.max_row or 0) <= EXCEL_STREAM_ROWS:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            return pd.read_excel(source, sheet_name=sheet.title, engine="openpyxl")
 
-            if len(df) == 1:
-                df = list(df.values())[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = _sheet_header(next(rows, ()))
+        blocks, block = [], []
+        for row in rows:
+            block.append(row[:len(header)])
+            if len(block) == EXCEL_STREAM_ROWS:
+                blocks.append(pd.DataFrame(block, columns=header))
+                block = []
+                if progress:
+                    progress(min(1.0, len(blocks) * EXCEL_STREAM_ROWS / sheet.max_row))
+        if block or not blocks:
+            blocks.append(pd.DataFrame(block, columns=header))
+    finally:
+        workbook.close()
 
-        elif file_name.endswith(".sav"):
-            df, meta = pyreadstat.read_sav(file_path)
+    df = pd.concat(blocks, ignore_index=True)
+    # Like pandas, drop the empty rows formatting often leaves at the bottom of a sheet
+    filled = np.flatnonzero(df.notna().any(axis=1).to_numpy())
+    # Blocks that were all empty in a column leave it as object; infer the types over the whole column
+    return df.iloc[:filled[-1] + 1 if len(filled) else 0].infer_objects()
 
+
+def _sheet_header(row):
+    # Same naming as pandas: unnamed columns become "Unnamed: i", repeats get a ".n" suffix
+    header, seen = [], {}
+    for i, name in enumerate(row):
+        name = f"Unnamed: {i}" if name is None else name
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
         else:
-            return None, {"error": "Unsupported file type"}
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def _optimize_series(series, value_labels=None):
+    """Returns a compact version of a column, or the column itself when it can't be shrunk losslessly."""
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy()
+        missing = np.isnan(values)
+        present = values[~missing]
+        if present.size and not (np.all(np.mod(present, 1) == 0) and np.abs(present).max() < 2 ** 62):
+            return series  # Genuine decimals
+
+        if value_labels:
+            # Labelled codes: the label set defines the domain, so unused answers stay valid categories
+            codes = [code for code in value_labels if isinstance(code, (int, float))]
+            return pd.Series(pd.Categorical(values, categories=np.union1d(np.unique(present), codes)),
+                             index=series.index, name=series.name)
+
+        int_dtype = _smallest_int(present)
+        if missing.any():
+            return series.astype(pd.api.types.pandas_dtype(int_dtype.__name__.capitalize()))  # Nullable IntN
+        return series.astype(int_dtype)
+
+    if pd.api.types.is_integer_dtype(series.dtype) and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        int_dtype = _smallest_int(series.to_numpy())
+        return series if int_dtype == series.dtype else series.astype(int_dtype)
+
+    is_text = series.dtype == object or isinstance(series.dtype, pd.StringDtype)
+    if is_text and len(series) and pd.api.types.infer_dtype(series, skipna=True) == "string":
+        if series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+            return series.astype("category")
+
+    return series
+
+
+def _smallest_int(values):
+    if values.size == 0:
+        return np.int8
+    low, high = values.min(), values.max()
+    return next(dtype for dtype in INT_DTYPES if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max)
+
+
+@perf_utils.timed("optimize")
+def optimize_dtypes(df, meta=None):
+    """
+    Downcasts a frame to compact dtypes: SAV coded variables with value labels become categoricals,
+    other whole-number columns the smallest (nullable) integer type, and repetitive text categoricals.
+    Original dtypes are kept in df.attrs["original_dtypes"] so save_file writes identical files.
+    """
+    value_labels = getattr(meta, "variable_value_labels", None) or {}
+    original_dtypes = dict(df.attrs.get("original_dtypes", {}))
+    columns = {}
+
+    for column in df.columns:
+        optimized = _optimize_series(df[column], value_labels.get(column))
+        if optimized is not df[column]:
+            original_dtypes.setdefault(column, str(df[column].dtype))
+        columns[column] = optimized
+
+    optimized_df = pd.DataFrame(columns, index=df.index)
+    optimized_df.attrs = {**df.attrs, "original_dtypes": original_dtypes}
+    return optimized_df
+
+
+def restore_dtypes(df):
+    """Casts columns of an optimized frame back to the dtypes they were loaded with."""
+    original_dtypes = df.attrs.get("original_dtypes")
+    if not original_dtypes:
+        return df
+
+    restored = pd.DataFrame({
+        column: df[column].astype(original_dtypes[column]) if column in original_dtypes else df[column]
+        for column in df.columns
+    }, index=df.index)
+    restored.attrs = {key: value for key, value in df.attrs.items() if key != "original_dtypes"}
+    return restored
+
+
+def file_hash(file_path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's content."""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    if key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        _hash_memo[key] = digest.hexdigest()
+
+    return _hash_memo[key]
+
+
+def _cache_paths(content_hash):
+    return os.path.join(CACHE_FOLDER, f"{content_hash}.arrow"), os.path.join(CACHE_FOLDER, f"{content_hash}.meta.pkl")
+
 
+def _read_cache(content_hash):
+    """Returns (df, meta) from the cache entry of a content hash, or None if there is none."""
+    data_path, meta_path = _cache_paths(content_hash)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+
+    try:
+        df = feather.read_table(data_path, memory_map=True).to_pandas()
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+        os.utime(data_path)  # Last use, for evict_cache
         return df, meta
+    except Exception as e:
+        perf_utils.log("cache_unreadable", logging.WARNING, path=data_path, error=str(e))
+        return None
 
+
+def _write_cache(content_hash, df, meta):
+    """Stores a parsed frame in the cache. Returns the Arrow file path, or None if it can't be cached."""
+    data_path, meta_path = _cache_paths(content_hash)
+    try:
+        feather.write_feather(df, data_path, compression="uncompressed")
+        with open(meta_path, "wb") as f:
+            pickle.dump(meta, f)
+        return data_path
     except Exception as e:
-        print(e)
-        return
+        # Frames Arrow can't represent (e.g. mixed-type object columns) are just not cached
+        perf_utils.log("cache_write_failed", logging.WARNING, hash=content_hash, error=str(e))
+        for path in (data_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return None
+
+
+def evict_cache(keep=(), max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+    """
+    Deletes cache entries unused for longer than ttl seconds, then the least recently used ones
+    until the cache fits in max_bytes. Entries whose Arrow file is in `keep` (paths still referenced
+    by a session or a job) are never deleted. Returns the number of entries deleted.
+    """
+    keep = {os.path.abspath(path) for path in keep if path}
+    entries = {}
+    for name in os.listdir(CACHE_FOLDER):
+        if name.endswith(".arrow"):
+            key = name[:-len(".arrow")]
+        elif name.endswith(".meta.pkl"):
+            key = name[:-len(".meta.pkl")]
+        else:
+            continue
+        path = os.path.join(CACHE_FOLDER, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        size, used = entries.get(key, (0, 0.0))
+        entries[key] = (size + stat.st_size, max(used, stat.st_mtime) if name.endswith(".arrow") else used)
+
+    now = time.time()
+    total = sum(size for size, _ in entries.values())
+    deleted = 0
+    # Oldest first: expired entries always go, the others only while the cache is over max_bytes
+    for key, (size, used) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+        if now - used <= ttl and total <= max_bytes:
+            break
+        data_path, meta_path = _cache_paths(key)
+        if os.path.abspath(data_path) in keep:
+            continue
+        for path in (data_path, meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                perf_utils.log("cache_eviction_failed", logging.WARNING, path=path, error=str(e))
+        total -= size
+        deleted += 1
+
+    if deleted:
+        perf_utils.log("cache_evicted", entries=deleted, remaining_mb=round(total / 1e6, 1))
+    return deleted
+
+
+def _sheet_id(sheet_name):
+    return hashlib.sha256(str(sheet_name).encode()).hexdigest()[:12]
+
+
+def _cache_key(content_hash, optimize=False, sheet_name=None):
+    # Each workbook sheet, and optimized frames, are cached apart from the as-loaded file
+    key = content_hash
+    if sheet_name is not None:
+        key += f".sheet-{_sheet_id(sheet_name)}"
+    return f"{key}.opt" if optimize else key
+
+
+def _is_cache_entry(file_path):
+    return os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(CACHE_FOLDER) and file_path.endswith(".arrow")
+
+
+def dataset_sheet_id(file_path, sheet_name=None):
+    """
+    Id of the workbook sheet a dataset comes from (the .sheet-<id> part of its cache key), or None for
+    files that aren't workbooks and for a workbook's default first sheet. Cache entries carry it in their name.
+    """
+    if _is_cache_entry(file_path):
+        parts = os.path.basename(file_path)[:-len(".arrow")].split(".")[1:]
+        return next((part[len("sheet-"):] for part in parts if part.startswith("sheet-")), None)
+    if sheet_name is None or not file_path.lower().endswith(".xlsx"):
+        return None
+    return _sheet_id(sheet_name)
+
+
+def load_file_cached(file_path, optimize=False, sheet_name=None):
+    """
+    Loads a file through the on-disk columnar cache.
+    The first load parses the file and stores it as an uncompressed Arrow file
+    (plus the pickled pyreadstat metadata), keyed by content hash (and sheet); later loads
+    memory-map the Arrow file instead of re-parsing.
+    Cache entries themselves (cache/<hash>.arrow) can also be passed as file_path.
+    Returns (df, meta, content_hash).
+    """
+    if _is_cache_entry(file_path):
+        cache_key = os.path.basename(file_path)[:-len(".arrow")]
+        df, meta = _read_cache(cache_key) or (None, None)
+        return df, meta, cache_key.split(".")[0]
+
+    content_hash = file_hash(file_path)
+    with perf_utils.stage("load_cached", file=os.path.basename(file_path)) as record:
+        cached = _read_cache(_cache_key(content_hash, optimize, sheet_name))
+        record["rows"] = len(cached[0]) if cached else None
+        record["hit"] = cached is not None
+    if cached:
+        return (*cached, content_hash)
+
+    loaded = load_file(file_path, optimize=optimize, sheet_name=sheet_name)
+    if not loaded:
+        return None, None, content_hash
+    df, meta = loaded
+
+    _write_cache(_cache_key(content_hash, optimize, sheet_name), df, meta)
+    return df, meta, content_hash
+
+
+def _read_sav(file_path, progress=None):
+    """
+    pyreadstat.read_sav, reporting progress(fraction) for large files by reading them in SAV_PROGRESS_CHUNKS chunks.
+    Chunking costs some speed, so files read without progress are read in one go.
+    """
+    if progress is None:
+        return pyreadstat.read_sav(file_path)
+
+    _, meta = pyreadstat.read_sav(file_path, metadataonly=True)
+    n_rows = meta.number_rows
+    if not n_rows or n_rows <= SAV_PROGRESS_ROWS:
+        return pyreadstat.read_sav(file_path)
+
+    chunks, n_read = [], 0
+    for chunk, _ in pyreadstat.read_file_in_chunks(pyreadstat.read_sav, file_path, chunksize=-(-n_rows // SAV_PROGRESS_CHUNKS)):
+        chunks.append(chunk)
+        n_read += len(chunk)
+        progress(n_read / n_rows)
+    return pd.concat(chunks, ignore_index=True), meta
+
+
+def _stage_bytes(buffer, suffix):
+    """
+    Writes buffer to a temporary file and returns it, on the memory-backed /dev/shm when it has room
+    (Docker gives it 64MB by default), in the regular temporary folder otherwise.
+    """
+    if os.path.isdir("/dev/shm"):
+        stats = os.statvfs("/dev/shm")
+        if stats.f_bavail * stats.f_frsize > 2 * len(buffer):  # Leave room for whatever else uses it
+            f = tempfile.NamedTemporaryFile(suffix=suffix, dir="/dev/shm", delete=False)
+            try:
+                with f:
+                    f.write(buffer)
+                return f
+            except OSError as e:  # Filled up since the check
+                os.remove(f.name)
+                perf_utils.log("shm_write_failed", logging.WARNING, size=len(buffer), error=str(e))
+
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(buffer)
+    return f
+
+
+def _parse_buffer(uploaded_file, buffer, sheet_name=None, progress=None):
+    """
+    Parses an upload from memory. Only SAV files, which pyreadstat can only read from a path, touch a file.
+    SAV files and large sheets report progress(fraction) while they parse; CSVs are parsed in one multithreaded call.
+    """
+    file_name = uploaded_file.name.lower()
 
+    if file_name.endswith(".csv"):
+        # pyarrow reads straight from the upload's memory without copying it
+        # Empty text cells are missing values, as with pd.read_csv (load_file, the CLI)
+        table = pa_csv.read_csv(pa.py_buffer(buffer), convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+        # pyarrow also infers dates and timestamps that pd.read_csv keeps as text; those columns are
+        # read again as strings so both paths agree and outputs keep the source values
+        temporal = {field.name: pa.string() for field in table.schema if pa.types.is_temporal(field.type)}
+        if temporal:
+            options = pa_csv.ConvertOptions(strings_can_be_null=True, column_types=temporal)
+            table = pa_csv.read_csv(pa.py_buffer(buffer), convert_options=options)
+        return table.to_pandas(), None
 
-def save_file(df, file_path, metadata=None):
+    if file_name.endswith(".xlsx"):
+        uploaded_file.seek(0)
+        return read_sheet(uploaded_file, sheet_name, progress), None
+
+    if file_name.endswith(SAV_EXTENSIONS):
+        f = _stage_bytes(buffer, ".sav")
+        try:
+            return _read_sav(f.name, progress)
+        finally:
+            os.remove(f.name)
+
+    return None, {"error": "Unsupported file type"}
+
+
+def load_uploaded_file(uploaded_file, folder=UPLOAD_FOLDER, optimize=False, sheet_name=None, content_hash=None, progress=None):
+    """
+    Loads a Streamlit upload without writing it to disk first and re-reading it.
+    Identical uploads are deduplicated by content hash: a known file is served from the cache
+    without parsing. New files are parsed from memory and stored in the cache,
+    downcast to compact dtypes first with optimize (see optimize_dtypes).
+    Workbooks load and cache the sheet_name sheet (the first one by default).
+    Returns (df, meta, content_hash, file_path), file_path being the cache entry that background
+    jobs can load, or a saved copy of the upload when the frame can't be cached.
+    `content_hash` skips hashing an upload whose hash is already known. `progress(fraction, stage)`
+    is called as the upload is parsed, optimized and cached (see ingest_utils); it may raise
+    LoadCancelled to stop the load, which then propagates without anything being cached.
+    """
+    buffer = uploaded_file.getbuffer()
+    content_hash = content_hash or hashlib.sha256(buffer).hexdigest()
+    cache_key = _cache_key(content_hash, optimize, sheet_name)
+    data_path, _ = _cache_paths(cache_key)
+
+    with perf_utils.stage("load_cached", file=uploaded_file.name) as record:
+        cached = _read_cache(cache_key)
+        record["rows"] = len(cached[0]) if cached else None
+        record["hit"] = cached is not None
+    if cached:
+        return (*cached, content_hash, data_path)
+
+    parse_progress = (lambda fraction: progress(fraction, "Parsing")) if progress else None
+    try:
+        with perf_utils.stage("load", file=uploaded_file.name) as record:
+            df, meta = _parse_buffer(uploaded_file, buffer, sheet_name, parse_progress)
+            record["rows"] = len(df) if isinstance(df, pd.DataFrame) else None
+    except LoadCancelled:
+        raise
+    except Exception as e:
+        perf_utils.log("load_failed", logging.ERROR, file=uploaded_file.name, error=str(e))
+        return None, None, content_hash, None
+    if df is None:
+        return None, meta, content_hash, None
+    if optimize and isinstance(df, pd.DataFrame):
+        if progress:
+            progress(1.0, "Optimizing dtypes")
+        df = optimize_dtypes(df, meta)
+
+    if progress:
+        progress(1.0, "Caching")
+    file_path = _write_cache(cache_key, df, meta) or save_uploaded_file(uploaded_file, folder)
+    return df, meta, content_hash, file_path
+
+
+def read_file_info(file_path):
+    """
+    Returns (n_rows, columns, meta) without loading the data.
+    SAV row counts come from the file header; CSVs need one pass over a single column.
+    """
+    file_name = file_path.lower()
+
+    if file_name.endswith(SAV_EXTENSIONS):
+        _, meta = pyreadstat.read_sav(file_path, metadataonly=True)
+        n_rows = meta.number_rows
+        if n_rows is None:
+            # Some writers leave the row count out of the header
+            n_rows = sum(len(chunk) for _, chunk, _ in iter_chunks(file_path, columns=meta.column_names[:1]))
+        return n_rows, list(meta.column_names), meta
+
+    if file_name.endswith(".csv"):
+        columns = list(pd.read_csv(file_path, nrows=0).columns)
+        n_rows = sum(len(chunk) for chunk in pd.read_csv(file_path, usecols=columns[:1], chunksize=CSV_CHUNK_ROWS))
+        return n_rows, columns, None
+
+    df, meta = load_file(file_path)
+    return len(df), list(df.columns), meta
+
+
+def load_columns(file_path, columns):
+    """Loads only the given columns of a CSV or SAV file (other types are loaded whole, then projected)."""
+    file_name = file_path.lower()
+
+    if file_name.endswith(SAV_EXTENSIONS):
+        return pyreadstat.read_sav(file_path, usecols=list(columns))
+    if file_name.endswith(".csv"):
+        return pd.read_csv(file_path, usecols=list(columns)), None
+
+    df, meta = load_file(file_path)
+    return df[list(columns)], meta
+
+
+def csv_dtypes(file_path, chunksize=CSV_CHUNK_ROWS):
+    """
+    The column dtypes a whole-file pd.read_csv infers, found in one pass over the file's chunks.
+    Each chunk infers its own otherwise, so e.g. an integer column with blanks only near the end
+    would switch from 1 to 1.0 partway through a streamed output.
+    """
+    seen = {}
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        for column, dtype in chunk.dtypes.items():
+            seen.setdefault(column, set()).add(dtype)
+
+    dtypes = {}
+    for column, found in seen.items():
+        if len(found) == 1:
+            dtypes[column] = found.pop()
+        elif all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in found):
+            dtypes[column] = np.result_type(*found)  # e.g. int64 chunks and float64 ones (with blanks) read as float64
+        else:
+            dtypes[column] = "str"  # Mixed text and numbers read as text, as in a whole-file read
+    return dtypes
+
+
+def iter_chunks(file_path, chunksize=CSV_CHUNK_ROWS, columns=None, dtype=None):
+    """
+    Yields (row_offset, chunk_df, meta) over a CSV or SAV file without loading it whole.
+    `dtype` fixes the CSV column types (see csv_dtypes). Other file types are yielded as a single chunk.
+    """
+    file_name = file_path.lower()
+    offset = 0
+
+    if file_name.endswith(SAV_EXTENSIONS):
+        chunks = pyreadstat.read_file_in_chunks(pyreadstat.read_sav, file_path, chunksize=chunksize, usecols=columns)
+    elif file_name.endswith(".csv"):
+        chunks = ((chunk, None) for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=columns, dtype=dtype))
+    else:
+        df, meta = load_file(file_path)
+        chunks = [(df if columns is None else df[columns], meta)]
+
+    for chunk, meta in chunks:
+        yield offset, chunk, meta
+        offset += len(chunk)
+
+
+def _chunk_rows(rows, offset, end):
+    """Positions of sorted `rows` falling inside the chunk [offset, end), relative to the chunk."""
+    return rows[np.searchsorted(rows, offset):np.searchsorted(rows, end)] - offset
+
+
+def stream_export(file_path, jobs, metadata=None, chunksize=CSV_CHUNK_ROWS, progress=None):
+    """
+    Writes (output_path, rows) jobs by streaming the source file chunk by chunk,
+    so the full dataset is never held in memory. `rows` are sorted positions in the source.
+    CSV outputs are all appended to chunk by chunk in a single pass. XLSX and SAV writers can't
+    append, so each of those outputs gets a pass of its own that collects its rows and writes them
+    before the next one starts: memory is bounded by the largest single output, at the cost of one
+    read of the source per output.
+    CSV sources are first read once to fix their column types (see csv_dtypes), so every chunk is
+    written as a whole-file load would have read it.
+    `progress(rows_read)` is called after each chunk, counting rows over all passes. Returns {output_path: error dict}.
+    """
+    errors = {}
+    dtype = csv_dtypes(file_path, chunksize) if file_path.lower().endswith(".csv") else None
+    csv_jobs = [(path, rows) for path, rows in jobs if path.lower().endswith(".csv")]
+    other_jobs = [(path, rows) for path, rows in jobs if not path.lower().endswith(".csv")]
+    rows_read = 0
+
+    if csv_jobs:
+        started = set()
+        for offset, chunk, _ in iter_chunks(file_path, chunksize, dtype=dtype):
+            end = offset + len(chunk)
+            for path, rows in csv_jobs:
+                with open(path, "a" if path in started else "w", newline="") as f:
+                    chunk.iloc[_chunk_rows(rows, offset, end)].to_csv(f, index=False, header=path not in started)
+                started.add(path)
+
+            rows_read += len(chunk)
+            if progress:
+                progress(rows_read)
+
+    for path, rows in other_jobs:
+        parts = []
+        for offset, chunk, chunk_meta in iter_chunks(file_path, chunksize, dtype=dtype):
+            metadata = metadata or chunk_meta
+            end = offset + len(chunk)
+            parts.append(chunk.iloc[_chunk_rows(rows, offset, end)])
+
+            rows_read += len(chunk)
+            if progress:
+                progress(rows_read)
+            if len(rows) == 0 or end > rows[-1]:
+                break  # The rest of the file holds none of this output's rows
+
+        result = save_file(pd.concat(parts, ignore_index=True), path, metadata=metadata)
+        if result:
+            errors[path] = result
+
+    return errors
+
+
+def save_file(df, file_path, metadata=None, rows=None):
+    """
+    Saves a DataFrame to CSV, XLSX, SAV or compressed SAV (.zsav) format.
+    `rows` optionally restricts the output to those integer positions of df;
+    CSVs are then streamed in chunks instead of building the subset in memory.
+    Optimized frames are written with their original dtypes.
+    """
+    file_type = file_path.rsplit(".", 1)[-1].lower()
+
+    try:
+        with perf_utils.stage("save", rows=len(df) if rows is None else len(rows), file=os.path.basename(file_path)):
+            if file_type == "csv":
+                _write_csv(df, file_path, rows)
+
+            elif file_type == "xlsx":
+                df = restore_dtypes(df if rows is None else df.iloc[rows])
+                df.to_excel(file_path, index=False, engine="xlsxwriter")
+
+            elif file_type in ("sav", "zsav"):
+                df = restore_dtypes(df if rows is None else df.iloc[rows])
+                pyreadstat.write_sav(df, file_path, compress=file_type == "zsav", **sav_write_options(metadata, df.columns))
+            else:
+                perf_utils.log("save_failed", logging.ERROR, file=file_path, error="Unsupported file type")
+                return {"error": "Unsupported file type"}
+
+    except Exception as e:
+        perf_utils.log("save_failed", logging.ERROR, file=file_path, error=str(e))
+        return {"error": str(e)}
+
+
+def _extract_sav_options(metadata):
+    # Measures SPSS doesn't know (pyreadstat reports "unknown") can't be written back
+    measures = getattr(metadata, "variable_measure", None) or {}
+    return {
+        "file_label": getattr(metadata, "file_label", None) or "",
+        "note": list(getattr(metadata, "notes", None) or []) or None,
+        "column_labels": dict(getattr(metadata, "column_names_to_labels", None) or {}),
+        "variable_value_labels": getattr(metadata, "variable_value_labels", None) or {},
+        "missing_ranges": getattr(metadata, "missing_ranges", None) or {},
+        "variable_format": getattr(metadata, "original_variable_types", None) or {},
+        "variable_measure": {column: measure for column, measure in measures.items() if measure in SAV_MEASURES},
+        "variable_display_width": getattr(metadata, "variable_display_width", None) or {},
+    }
+
+
+def sav_write_options(metadata, columns):
     """
-    Saves a DataFrame to CSV, XLSX, or SAV format.
+    Keyword arguments for pyreadstat.write_sav carrying over a source file's metadata: file label, notes,
+    column and value labels, missing ranges, formats, measure levels and display widths, pruned to the
+    columns being written. Extracted once per metadata object and pruned once per column set, so the
+    dozens of files of a bootstrap all reuse the same options.
     """
-    print(file_path)    
-    file_type = file_path.split(".")[1]  
+    if metadata is None:
+        return {}
 
     try:
-        if file_type == "csv":
-            df.to_csv(file_path, index=False)
-
-        elif file_type == "xlsx":
-            df.to_excel(file_path, index=False, engine="xlsxwriter")
-
-        elif file_type == "sav":
-                    pyreadstat.write_sav(
-                        df, file_path, 
-                        column_labels=metadata.column_labels,
-                        variable_value_labels=metadata.variable_value_labels,
-                        missing_ranges=metadata.missing_ranges)
+        options = _sav_options.setdefault(metadata, {})
+    except TypeError:  # Metadata stand-ins that can't be weakly referenced are extracted every time
+        options = {}
+    if "all" not in options:
+        options["all"] = _extract_sav_options(metadata)
+
+    columns = tuple(columns)
+    if columns not in options:
+        everything = options["all"]
+        selected = set(columns)
+        options[columns] = {
+            "file_label": everything["file_label"],
+            "note": everything["note"],
+            "column_labels": [everything["column_labels"].get(column) for column in columns],
+            **{
+                name: {column: value for column, value in everything[name].items() if column in selected}
+                for name in ("variable_value_labels", "missing_ranges", "variable_format", "variable_measure", "variable_display_width")
+            },
+        }
+    return options[columns]
+
+
+def _write_csv(df, file_path, rows=None, append=False):
+    """
+    Writes df (or the given row positions of it) to CSV in chunks of CSV_CHUNK_ROWS.
+    With append, the rows are added to the end of an existing file, without a header.
+    """
+    n_rows = len(df) if rows is None else len(rows)
+
+    with open(file_path, "a" if append else "w", newline="") as f:
+        if n_rows == 0:
+            if not append:
+                restore_dtypes(df.iloc[:0]).to_csv(f, index=False)
+            return
+
+        for start in range(0, n_rows, CSV_CHUNK_ROWS):
+            stop = start + CSV_CHUNK_ROWS
+            chunk = df.iloc[start:stop] if rows is None else df.iloc[rows[start:stop]]
+            restore_dtypes(chunk).to_csv(f, index=False, header=start == 0 and not append)
+
+
+def append_file(df, file_path, rows, new_path=None, metadata=None):
+    """
+    Appends the given row positions of df to an existing output file, then renames it to new_path
+    (e.g. when the row count in its name changes). CSVs are appended in place, so only the new rows
+    are written; XLSX and SAV files can't be appended to and are read back and rewritten whole.
+    A file that doesn't exist yet is simply created with those rows.
+    """
+    new_path = new_path or file_path
+    if not os.path.exists(file_path):
+        return save_file(df, new_path, metadata=metadata, rows=rows)
+
+    try:
+        if file_path.lower().endswith(".csv"):
+            with perf_utils.stage("save", rows=len(rows), file=os.path.basename(new_path), append=True):
+                _write_csv(df, file_path, rows, append=True)
         else:
-            print("error")
-            return {"error": "Unsupported file type"}
-        
-        print(f"✅ File saved successfully at {file_path}")
+            existing, _ = load_file(file_path)
+            if existing is None:
+                return {"error": f"Could not read {os.path.basename(file_path)}"}
+            result = save_file(pd.concat([existing, restore_dtypes(df.iloc[rows])], ignore_index=True), new_path, metadata=metadata)
+            if result:
+                return result
+            if new_path != file_path:
+                os.remove(file_path)
+            return
+        if new_path != file_path:
+            os.replace(file_path, new_path)
 
     except Exception as e:
-        print(e)
+        perf_utils.log("save_failed", logging.ERROR, file=file_path, error=str(e))
         return {"error": str(e)}
 
 
+# Source frame and metadata shared by every job of an export, set once per worker process
+_export_source = None
+
+
+def _init_export_worker(df, metadata):
+    global _export_source
+    _export_source = (df, metadata)
+
+
+def _export_job(file_path, rows):
+    df, metadata = _export_source
+    return save_file(df, file_path, metadata=metadata, rows=rows)
+
+
+def export_files(df, jobs, metadata=None, max_workers=None, progress=None):
+    """
+    Writes several subsets of df concurrently on a process pool.
+    `jobs` is a list of (file_path, rows) pairs, rows being integer positions of df.
+    The source frame is sent once per worker rather than once per file.
+    `progress(done, total, file_path)` is called as each file finishes.
+    Returns {file_path: error dict} for the files that failed.
+    """
+    errors = {}
+    total = len(jobs)
+    if total == 0:
+        return errors
+
+    max_workers = min(total, max_workers or os.cpu_count() or 1)
+
+    if max_workers == 1:
+        # Not worth starting a pool for a single writer
+        for done, (file_path, rows) in enumerate(jobs, start=1):
+            result = save_file(df, file_path, metadata=metadata, rows=rows)
+            if result:
+                errors[file_path] = result
+            if progress:
+                progress(done, total, file_path)
+        return errors
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_export_worker, initargs=(df, metadata)) as pool:
+        futures = {pool.submit(_export_job, file_path, rows): file_path for file_path, rows in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e)}
+            if result:
+                errors[file_path] = result
+            if progress:
+                progress(done, total, file_path)
+
+    return errors
+
+
 def empty_folder(folder_path):
     """
     Empties the contents of a folder using only the os module.
@@ -92,11 +841,11 @@ def empty_folder(folder_path):
                 elif os.path.isdir(item_path):
                     os.rmdir(item_path)  # Remove empty directory
             except Exception as e:
-                print(f"Error removing {item_path}: {e}")
+                perf_utils.log("remove_failed", logging.WARNING, path=item_path, error=str(e))
 
-        print(f"Folder '{folder_path}' emptied successfully.")
+        perf_utils.log("folder_emptied", folder=folder_path)
     else:
-        print("Invalid folder path or folder does not exist.")
+        perf_utils.log("folder_missing", logging.WARNING, folder=folder_path)
 
 
 def get_label(metadata, column, value):
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+MAX_BITMAP_VALUES = 1024  # Columns with more distinct values are matched on codes instead of bitmaps
+
+
+class SegmentIndex:
+    """
+    Pre-encoded view of a DataFrame for fast segment filtering.
+
+    Filterable columns are factorized into categorical codes on first use, and each selected
+    value gets a packed bitmap (one bit per row), so a multi-column segment is a handful of
+    bitwise ORs and ANDs instead of repeated isin calls over the full frame.
+
+    Filters are a list of conditions that are AND-ed together. A condition is either
+    {"column": name, "values": [...], "negate": bool} or {"any": [conditions...]} for an OR group.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n_rows = len(df)
+        self._codes = {}  # column -> (codes, {value: code})
+        self._bitmaps = {}  # (column, code) -> packed bitmap
+        self._all = np.packbits(np.ones(self.n_rows, dtype=bool))  # Valid bits, used to clear padding after NOT
+
+    def _encode(self, column):
+        if column not in self._codes:
+            codes, uniques = pd.factorize(self.df[column], use_na_sentinel=True)
+            self._codes[column] = (codes, {value: code for code, value in enumerate(uniques)})
+        return self._codes[column]
+
+    def _value_bitmap(self, column, code):
+        key = (column, code)
+        if key not in self._bitmaps:
+            codes, _ = self._encode(column)
+            self._bitmaps[key] = np.packbits(codes == code)
+        return self._bitmaps[key]
+
+    def _condition_bits(self, condition):
+        if "any" in condition:
+            bits = np.zeros_like(self._all)
+            for sub_condition in condition["any"]:
+                bits |= self._condition_bits(sub_condition)
+        else:
+            codes, lookup = self._encode(condition["column"])
+            # NaN never equals itself, so it is looked up through the -1 sentinel
+            selected = {-1 if pd.isna(value) else lookup.get(value) for value in condition["values"]}
+            selected.discard(None)
+
+            if len(lookup) <= MAX_BITMAP_VALUES:
+                bits = np.zeros_like(self._all)
+                for code in selected:
+                    bits |= self._value_bitmap(condition["column"], code)
+            else:
+                bits = np.packbits(np.isin(codes, list(selected)))
+
+        if condition.get("negate"):
+            bits = ~bits & self._all
+        return bits
+
+    def mask_bits(self, filters: list):
+        """Returns the packed bitmap of rows matching every filter."""
+        bits = self._all.copy()
+        for condition in filters:
+            bits &= self._condition_bits(condition)
+        return bits
+
+    def mask(self, filters: list):
+        """Returns a boolean NumPy mask of rows matching every filter."""
+        return np.unpackbits(self.mask_bits(filters), count=self.n_rows).astype(bool)
+
+    def count(self, filters: list):
+        """Returns the number of rows matching every filter, without building a mask."""
+        return int(np.bitwise_count(self.mask_bits(filters)).sum())
+
+
+def conditions_from_dicts(filters: list):
+    """Converts the [{column: values, ...}] format of user_selections.json into conditions."""
+    return [
+        {"column": column, "values": values}
+        for filter_dict in filters
+        for column, values in filter_dict.items()
+    ]
+
+
+def condition_columns(filters: list):
+    """Lists the columns referenced by a list of conditions, including inside OR groups."""
+    columns = []
+    for condition in filters:
+        if "any" in condition:
+            columns.extend(condition_columns(condition["any"]))
+        else:
+            columns.append(condition["column"])
+    return list(dict.fromkeys(columns))
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import threading
+from utils import files_utils, perf_utils
+
+
+class Ingestion:
+    """
+    One upload loading in a background thread. The thread updates progress and message as it goes,
+    then sets result (df, meta, content_hash, file_path) or error, and done.
+    """
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.progress = 0.0
+        self.message = "Waiting"
+        self.result = None
+        self.error = None
+        self.sessions = 1
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def report(self, fraction, message):
+        """Progress callback for files_utils.load_uploaded_file; raises LoadCancelled once cancelled."""
+        if self.cancelled.is_set():
+            raise files_utils.LoadCancelled(self.name)
+        self.progress = fraction
+        self.message = message
+
+
+# Loads in flight in this server process by (content hash, optimize, sheet), shared by every session
+_ingestions = {}
+_lock = threading.Lock()
+
+
+def start(uploaded_file, folder, optimize=False, sheet_name=None, sink=None):
+    """
+    Starts loading an upload in a background thread (see files_utils.load_uploaded_file) and returns its Ingestion.
+    An identical upload already loading, from this session or another one, is joined instead of parsed twice.
+    `sink` collects the stage records of the load (see perf_utils.set_sink).
+    """
+    # Hashing is fast next to parsing, and identifies the upload whatever its name
+    content_hash = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    key = (content_hash, optimize, sheet_name)
+
+    with _lock:
+        ingestion = _ingestions.get(key)
+        if ingestion is not None and not ingestion.cancelled.is_set():
+            ingestion.sessions += 1
+            return ingestion
+        ingestion = _ingestions[key] = Ingestion(key, uploaded_file.name)
+
+    source = uploaded_file
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        # Workbooks are read with seek/read, which must not interleave with the app listing their sheets
+        source = io.BytesIO(uploaded_file.getvalue())
+        source.name = uploaded_file.name
+
+    threading.Thread(
+        target=_load, args=(ingestion, source, folder, optimize, sheet_name, content_hash, sink),
+        name=f"ingest-{uploaded_file.name}", daemon=True
+    ).start()
+    return ingestion
+
+
+def _load(ingestion, source, folder, optimize, sheet_name, content_hash, sink):
+    perf_utils.set_sink(sink)
+    try:
+        ingestion.report(0.0, "Parsing")
+        result = files_utils.load_uploaded_file(source, folder=folder, optimize=optimize, sheet_name=sheet_name,
+                                                content_hash=content_hash, progress=ingestion.report)
+        if result[0] is None:
+            ingestion.error = "Could not parse the file"
+        else:
+            ingestion.result = result
+    except files_utils.LoadCancelled:
+        ingestion.error = "Cancelled"
+    except Exception as e:
+        ingestion.error = str(e)
+    finally:
+        ingestion.progress = 1.0
+        ingestion.done.set()
+        with _lock:
+            if _ingestions.get(ingestion.key) is ingestion:
+                del _ingestions[ingestion.key]
+
+
+def release(ingestion):
+    """
+    Lets go of a load a session no longer waits for (its upload was replaced or removed).
+    The load is cancelled when no other session is waiting for it.
+    """
+    with _lock:
+        ingestion.sessions -= 1
+        if ingestion.sessions <= 0 and not ingestion.done.is_set():
+            ingestion.cancelled.set()
+            if _ingestions.get(ingestion.key) is ingestion:
+                del _ingestions[ingestion.key]
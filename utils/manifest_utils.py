@@ -0,0 +1,144 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils import files_utils, split_utils
+
+
+MANIFEST_NAME = "manifest.npz"
+MANIFEST_VERSION = 1
+ROW_ID_MULTIPLIER = 0x100000001B3  # 64-bit FNV prime, mixes the column hashes of a row id
+WAVE_STREAM = 0x57415645  # Spawn key tag of the seed streams of later waves, apart from the replicate streams
+PARTS = [("train", split_utils.TRAIN), ("holdout", split_utils.HOLDOUT), ("baseline", split_utils.BASELINE)]
+
+
+def row_ids(df: pd.DataFrame, key: str = None):
+    """
+    One 64-bit hash per row identifying it across waves of a dataset: the hash of the key column
+    when there is one, otherwise of the whole row. Values are normalized first (numbers as floats,
+    everything else as text) so a row hashes the same whatever dtype a later file parses it with.
+    Columns are normalized and hashed one at a time, so only one column is ever copied.
+    """
+    ids = np.zeros(len(df), dtype=np.uint64)
+    for column in ([key] if key else df.columns):
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Each category (and the missing value, code -1) is hashed once, then looked up by code
+            lookup = pd.Series(pd.Categorical.from_codes(np.arange(-1, len(series.dtype.categories)), dtype=series.dtype))
+            hashes = _hash_values(lookup)[series.cat.codes.to_numpy().astype(np.int64) + 1]
+        else:
+            hashes = _hash_values(series)
+        # Order-dependent combination, so swapping values between columns changes the id
+        ids = ids * np.uint64(ROW_ID_MULTIPLIER) ^ hashes
+    return ids
+
+
+def match_rows(previous_ids: np.ndarray, ids: np.ndarray):
+    """
+    Position of every row of `ids` among `previous_ids`, or -1 for rows that are new.
+    Repeated ids are matched occurrence by occurrence, so an extra copy of an existing row counts as new.
+    """
+    def keyed(values):
+        occurrence = pd.Series(values).groupby(values).cumcount().to_numpy()
+        return pd.MultiIndex.from_arrays([values, occurrence])
+
+    return keyed(previous_ids).get_indexer(keyed(ids))
+
+
+def wave_seed(seed: int, wave: int):
+    """
+    Seed of the rows added in a later wave of a dataset: a stream of its own derived from the split's seed,
+    so every wave is reproducible from (seed, wave) and never reuses the draws of an earlier one.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(WAVE_STREAM, wave))
+
+
+def _hash_values(series: pd.Series):
+    values = pd.Index(series.dtype.categories) if isinstance(series.dtype, pd.CategoricalDtype) else series
+    numeric = pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype)
+    return pd.util.hash_pandas_object(series.astype("float64") if numeric else series.astype(str), index=False).to_numpy()
+
+
+def write_manifest(path, labels: np.ndarray, dataset_hash: str, spec: dict, row_ids: np.ndarray = None, **extra):
+    """
+    Saves a split as a manifest instead of data files: the spec that produced it (seed included),
+    the content hash of the source dataset, and one bit-packed row mask per part and replicate,
+    i.e. n_rows / 8 bytes where a data file holds a full copy of the rows.
+    `row_ids` (see row_ids) let a later wave of the dataset be split incrementally.
+    `extra` (e.g. the bootstrap summary) is stored alongside the spec.
+    """
+    n_replicates, n_rows = labels.shape
+    info = {
+        "version": MANIFEST_VERSION,
+        "dataset_hash": dataset_hash,
+        "n_rows": n_rows,
+        "n_replicates": n_replicates,
+        "spec": spec,
+        **extra,
+    }
+    masks = {name: np.packbits((labels & flag) != 0, axis=1) for name, flag in PARTS}
+    if row_ids is not None:
+        masks["row_ids"] = row_ids
+    np.savez_compressed(path, info=np.array(json.dumps(info)), **masks)
+    return path
+
+
+def read_row_ids(path):
+    """The row ids stored in a manifest, or None if it has none."""
+    with np.load(path, allow_pickle=False) as manifest:
+        return manifest["row_ids"] if "row_ids" in manifest.files else None
+
+
+def read_manifest(path):
+    """Returns (labels, info): the replicate label matrix rebuilt from the packed masks, and the manifest info."""
+    with np.load(path, allow_pickle=False) as manifest:
+        info = json.loads(str(manifest["info"]))
+        if info.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version: {info.get('version')}")
+
+        labels = np.zeros((info["n_replicates"], info["n_rows"]), dtype=np.uint8)
+        for name, flag in PARTS:
+            labels |= np.unpackbits(manifest[name], axis=1, count=info["n_rows"]) * np.uint8(flag)
+
+    return labels, info
+
+
+def materialize(manifest_path, dataset, output_dir, file_type=None, replicates=None, parts=None,
+                streaming=False, export_workers=None, sheet=None):
+    """
+    Rebuilds split files from a manifest and its source dataset, which must have the same content hash,
+    sheet (`sheet` defaults to the split's) and row count.
+    `replicates` (1-based numbers) and `parts` ("train", "holdout", "baseline") select which files to write;
+    by default all of them, named as the split itself would have named them.
+    With streaming, CSV and SAV datasets are streamed instead of loaded whole.
+    Returns (output paths, {output_path: error dict} for failed outputs).
+    """
+    labels, info = read_manifest(manifest_path)
+    spec = info["spec"]
+    sheet = sheet if sheet is not None else spec.get("sheet")
+    if files_utils.dataset_sheet_id(dataset, sheet) != info.get("sheet_id"):
+        raise ValueError(f"{dataset}: not the workbook sheet this manifest was made from (pass its sheet name)")
+
+    if streaming:
+        content_hash = files_utils.file_hash(dataset)
+        n_rows, _, meta = files_utils.read_file_info(dataset)
+    else:
+        df, meta, content_hash = files_utils.load_file_cached(dataset, optimize=spec.get("optimize_dtypes", False), sheet_name=sheet)
+        if df is None:
+            raise ValueError(f"Could not load {dataset}")
+        n_rows = len(df)
+    if content_hash != info["dataset_hash"]:
+        raise ValueError(f"{dataset} is not the dataset this manifest was made from")
+    if n_rows != info["n_rows"]:
+        raise ValueError(f"{dataset} has {n_rows} rows where the manifest has {info['n_rows']}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    file_type = file_type or info.get("file_type") or spec.get("file_type") or dataset.rsplit(".", 1)[-1].lower()
+    jobs = split_utils.output_jobs(labels, output_dir, file_type, has_baseline=spec["baseline"],
+                                   bootstrap=info["n_replicates"] > 1, replicates=replicates, parts=parts)
+
+    if streaming:
+        errors = files_utils.stream_export(dataset, jobs, metadata=meta)
+    else:
+        errors = files_utils.export_files(df, jobs, metadata=meta, max_workers=export_workers)
+    return [path for path, _ in jobs if path not in errors], errors
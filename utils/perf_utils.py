@@ -0,0 +1,90 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+
+LOG_LEVEL = os.environ.get("CSP_LOG_LEVEL", "INFO")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class _JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, event and the event's fields."""
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+logger = logging.getLogger("csplatform")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(_JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+# Each Streamlit session runs its script on its own thread, so stage records are collected per thread
+_local = threading.local()
+
+
+def log(event, level=logging.INFO, **fields):
+    """Writes a structured JSON log line, e.g. log("cache_miss", hash=...)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def set_sink(sink):
+    """Collects the stage records of the current thread into sink (a list or deque), or stops if None."""
+    _local.sink = sink
+
+
+def _rss():
+    """Resident memory of this process in bytes, read from /proc (0 where unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+@contextmanager
+def stage(name, rows=None, **fields):
+    """
+    Times a block of work and records its wall time, rows processed and resident memory delta.
+    The yielded record can be updated inside the block, e.g. record["rows"] = len(df).
+    Costs two clock reads and two small /proc reads, so it stays on in production.
+    """
+    record = {"stage": name, "rows": rows, **fields}
+    rss_before = _rss()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = str(e)
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        record["memory_delta_mb"] = round((_rss() - rss_before) / 2 ** 20, 1)
+        log("stage", **record)
+        sink = getattr(_local, "sink", None)
+        if sink is not None:
+            sink.append(record)
+
+
+def timed(name):
+    """Decorator form of stage(); rows are taken from the first argument when it is a DataFrame."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = len(args[0]) if args and isinstance(args[0], pd.DataFrame) else None
+            with stage(name, rows=rows, function=func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
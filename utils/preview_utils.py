@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+
+PREVIEW_ROWS = 1_000  # Rows in the sample preview
+PREVIEW_COLUMNS = 30  # Columns shown by default in wide datasets
+
+
+def sample_rows(df: pd.DataFrame, n_rows: int = PREVIEW_ROWS, seed: int = 0):
+    """A fixed random sample of rows, kept in file order, so the preview is representative of the whole file."""
+    if len(df) <= n_rows:
+        return df
+    positions = np.sort(np.random.default_rng(seed).choice(len(df), n_rows, replace=False))
+    return df.iloc[positions]
+
+
+def page_of_rows(df: pd.DataFrame, page: int = 1, page_size: int = 100, columns=None):
+    """
+    One page of rows (pages start at 1), restricted to the given columns.
+    Returns (page_df, n_pages). Only this window is ever sent to the browser.
+    """
+    n_pages = max(1, -(-len(df) // page_size))
+    page = min(max(1, page), n_pages)
+    window = df.iloc[(page - 1) * page_size:page * page_size]
+    return (window if columns is None else window[list(columns)]), n_pages
+
+
+def column_summary(df: pd.DataFrame):
+    """
+    One row of summary statistics per column: type, missing share, distinct values, most common value,
+    and min / max / mean for numeric columns (including numeric categoricals).
+    Everything comes from one factorize per column; the mean is weighted by value counts.
+    """
+    rows = []
+    n_rows = len(df)
+
+    for column in df.columns:
+        series = df[column]
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        n_present = int(counts.sum())
+
+        row = {
+            "column": column,
+            "type": str(series.dtype),
+            "missing (%)": round(100 * (n_rows - n_present) / n_rows, 2) if n_rows else 0.0,
+            "distinct": len(uniques),
+            "most common": str(uniques[counts.argmax()]) if len(uniques) else None,
+            "most common (%)": round(100 * counts.max() / n_present, 2) if n_present else None,
+            "min": None,
+            "max": None,
+            "mean": None,
+        }
+
+        values = pd.Index(uniques)
+        if isinstance(values, pd.CategoricalIndex):
+            values = pd.Index(np.asarray(values))
+        if len(values) and pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            values = values.to_numpy(dtype=float)
+            row["min"] = float(values.min())
+            row["max"] = float(values.max())
+            row["mean"] = round(float(values @ counts / n_present), 4)
+
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=["column", "type", "missing (%)", "distinct", "most common",
+                                       "most common (%)", "min", "max", "mean"])
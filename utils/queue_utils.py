@@ -0,0 +1,166 @@
+import functools
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils import batch_utils
+
+
+QUEUE_DB = "jobs.sqlite"
+MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Leave a core for the Streamlit server
+
+# Worker pool shared by every session of this server process, started on first submit
+_pool = None
+_pool_lock = threading.RLock()
+
+
+def _connect():
+    connection = sqlite3.connect(QUEUE_DB, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            dataset TEXT NOT NULL,
+            spec TEXT NOT NULL,
+            result TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+    """)
+    return connection
+
+
+def _update(job_id, **fields):
+    fields["updated"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as connection:
+        connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers are not forked from the multi-threaded Streamlit server
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context(method))
+            _recover()
+        return _pool
+
+
+def _submit(job_id):
+    future = _pool.submit(_run_job, job_id)
+    future.add_done_callback(functools.partial(_job_done, job_id, _pool))
+
+
+def _recover(message="Interrupted by a server restart"):
+    """Re-queues jobs left waiting (by a previous server process or a broken pool) and fails the ones it was running."""
+    with _connect() as connection:
+        queued = [row["id"] for row in connection.execute("SELECT id FROM jobs WHERE status = 'queued'")]
+        connection.execute("UPDATE jobs SET status = 'failed', message = ? WHERE status = 'running'", (message,))
+    for job_id in queued:
+        _submit(job_id)
+
+
+def _job_done(job_id, pool, future):
+    """
+    Fails a job whose worker never reported back. A worker that died (e.g. killed for running out
+    of memory) breaks the whole pool: it is replaced, the jobs it was running fail, and queued ones are resubmitted.
+    """
+    error = future.exception()
+    if error is None:
+        return
+
+    if isinstance(error, BrokenProcessPool):
+        with _pool_lock:
+            if _pool is pool:  # Only the first callback of a broken pool replaces it
+                _reset_pool()
+        return
+
+    with _connect() as connection:
+        connection.execute("UPDATE jobs SET status = 'failed', message = ?, updated = ? WHERE id = ? AND status IN ('queued', 'running')",
+                           (str(error), time.time(), job_id))
+
+
+def _run_job(job_id):
+    """Worker entry point: runs one queued split and records progress and result in the queue."""
+    # Claim the job atomically, so a job submitted twice (e.g. also re-queued by _recover) only runs once
+    with _connect() as connection:
+        claimed = connection.execute(
+            "UPDATE jobs SET status = 'running', message = 'Splitting', updated = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        ).rowcount
+        row = connection.execute("SELECT dataset, spec FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not claimed:
+        return
+
+    def progress(done, total, file_path):
+        _update(job_id, progress=done / total, message=f"Saved {file_path} ({done}/{total})")
+
+    try:
+        result = batch_utils.run_split(row["dataset"], json.loads(row["spec"]), export_workers=1, progress=progress)
+        status = "failed" if result["errors"] else "done"
+        _update(job_id, status=status, progress=1.0, message=None, result=json.dumps(result))
+    except Exception as e:
+        _update(job_id, status="failed", message=str(e))
+
+
+def submit(dataset, spec):
+    """Queues a split of a dataset file (see batch_utils for the spec format) and returns its job id."""
+    spec = batch_utils.load_spec(spec)
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with _pool_lock:
+        # Start the pool (re-queuing leftover jobs) before inserting, so the new job is only submitted here
+        _get_pool()
+        with _connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, dataset, spec, created, updated) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, dataset, json.dumps(spec), now, now)
+            )
+        try:
+            _submit(job_id)
+        except BrokenProcessPool:
+            # The pool broke before its done callbacks replaced it: a new pool picks the queued job up
+            _reset_pool()
+    return job_id
+
+
+def _reset_pool():
+    """Replaces a broken pool: the jobs it was running fail, and the queued ones go to the new pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        with _connect() as connection:
+            connection.execute("UPDATE jobs SET status = 'failed', message = ? WHERE status = 'running'",
+                               ("The worker process stopped unexpectedly (out of memory?)",))
+        _get_pool()
+
+
+def active_datasets():
+    """Dataset paths of the jobs still queued or running, which must not be deleted from under them."""
+    with _connect() as connection:
+        return [row["dataset"] for row in connection.execute("SELECT dataset FROM jobs WHERE status IN ('queued', 'running')")]
+
+
+def status(job_id):
+    """Returns the job as a dict (status, progress, message, result), or None if unknown."""
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    job = dict(row)
+    job["spec"] = json.loads(job["spec"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
@@ -1,65 +1,198 @@
+import io
+import os
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
-import matplotlib.pyplot as plt
-import streamlit as st
-from sklearn.model_selection import train_test_split
+from utils import files_utils, filter_utils, perf_utils
 
-def random_split(df: pd.DataFrame, train_size: float = 0.1, baseline: bool = True, remove_baseline: bool = True, random_states=None):
+
+# Bit flags used in replicate label matrices. Train rows are also baseline rows,
+# and holdout may overlap the baseline, so a row can carry several flags.
+TRAIN = 1
+HOLDOUT = 2
+BASELINE = 4
+
+MIN_STRATUM_SIZE = 10  # Strata smaller than this are merged when stratifying
+
+
+class SplitPlan:
     """
-    Splits the dataset into train, holdout, and optionally a baseline.
+    Integer row positions for one split. DataFrames are only built on materialize().
     """
-    if not isinstance(random_states, list):
-        random_states = [None]  # Default to a single random split without a seed
 
-    results = []
+    def __init__(self, train: np.ndarray, holdout: np.ndarray, baseline: np.ndarray = None, seed=None):
+        self.train = train
+        self.holdout = holdout
+        self.baseline = baseline
+        self.seed = seed
 
-    for seed in random_states:
-        if not baseline:
-            # Standard train-test split when baseline is not needed
-            train_df, holdout_df = train_test_split(df, train_size=train_size, random_state=seed)
-            results.append((train_df, holdout_df, None))
-            continue
+    @classmethod
+    def from_labels(cls, labels: np.ndarray, has_baseline: bool = True, seed=None):
+        """Builds a plan from one row of a label matrix."""
+        baseline = np.flatnonzero(labels & BASELINE) if has_baseline else None
+        return cls(np.flatnonzero(labels & TRAIN), np.flatnonzero(labels & HOLDOUT), baseline, seed=seed)
+
+    def sizes(self):
+        """Returns the row count of each part (None for a missing baseline)."""
+        return len(self.train), len(self.holdout), None if self.baseline is None else len(self.baseline)
 
-        # Compute baseline size as twice the training size
-        baseline_size = min(2 * train_size, 1.0)  # Ensure it doesn't exceed dataset size
+    def materialize(self, df: pd.DataFrame):
+        """Builds the (train, holdout, baseline) DataFrames from the source frame."""
+        baseline_df = df.iloc[self.baseline] if self.baseline is not None else None
+        return df.iloc[self.train], df.iloc[self.holdout], baseline_df
 
-        baseline_df, holdout_df = train_test_split(df, train_size=baseline_size, random_state=seed)
 
-        # Half of the baseline is assigned to training
-        train_df, _ = train_test_split(baseline_df, train_size=0.5, random_state=seed)
+def _split_positions(positions: np.ndarray, rng: np.random.Generator, train_size: float, baseline: bool,
+                     remove_baseline: bool, extend_baseline: bool = False, strata: np.ndarray = None):
+    """
+    Shuffles the candidate positions once and slices them into train / holdout / baseline.
+    Train is always the head of the permutation, so it is contained in the baseline.
+    The slices are views of the permutation and are not sorted.
+    `strata` (stratum codes aligned with positions) switches to a stratified split.
+    """
+    if strata is not None:
+        return _stratified_split_positions(positions, strata, rng, train_size, baseline, remove_baseline, extend_baseline)
+
+    perm = rng.permutation(positions)
+    n_train = int(train_size * len(perm))
 
-        if remove_baseline:
-            # Remove all baseline data from holdout
-            holdout_df = holdout_df.loc[~holdout_df.index.isin(baseline_df.index)]
-        else:
-            # Only remove train indexes from holdout
-            holdout_df = holdout_df.loc[~holdout_df.index.isin(train_df.index)]
+    if not baseline:
+        return perm[:n_train], perm[n_train:], None
 
-        results.append((train_df, holdout_df, baseline_df))
+    # Baseline is twice the training size, capped at the available rows
+    n_baseline = min(2 * n_train, len(perm))
+    baseline_pos = perm[:n_baseline]
 
-    return results
+    if remove_baseline:
+        # Holdout excludes the entire baseline
+        holdout_pos = perm[n_baseline:]
+    else:
+        # Holdout only excludes the train portion
+        holdout_pos = perm[n_train:]
+        if extend_baseline and len(perm) - n_baseline >= n_train:
+            # Extend the baseline with another train-sized draw from outside it
+            baseline_pos = perm[:n_baseline + n_train]
 
+    return perm[:n_train], holdout_pos, baseline_pos
 
-def filter_dataframe(data: pd.DataFrame, filters: list):
+
+def _allocate(sizes: np.ndarray, total: int, rng: np.random.Generator):
+    """
+    Splits `total` rows across strata proportionally to their sizes (largest remainder,
+    ties broken at random), so per-stratum rounding doesn't drift from the overall target.
+    """
+    quotas = sizes * (total / max(sizes.sum(), 1))
+    counts = np.floor(quotas).astype(np.int64)
+    remainder = total - counts.sum()
+    if remainder > 0:
+        order = np.lexsort((rng.random(len(sizes)), -(quotas - counts)))
+        counts[order[:remainder]] += 1
+    return np.minimum(counts, sizes)
+
+
+def _stratified_split_positions(positions, strata, rng, train_size, baseline, remove_baseline, extend_baseline):
+    """
+    Stratified version of _split_positions: shuffles within each stratum (one sort on
+    (stratum, random key)) and takes proportional train / baseline counts from each.
+    """
+    order = np.lexsort((rng.random(len(positions)), strata))
+    shuffled = positions[order]
+    shuffled_strata = strata[order]
+
+    # Rank of each row within its (shuffled) stratum
+    sizes = np.bincount(strata)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(len(shuffled)) - starts[shuffled_strata]
+
+    n_train = _allocate(sizes, int(train_size * len(positions)), rng)
+    in_train = rank < n_train[shuffled_strata]
+
+    if not baseline:
+        return shuffled[in_train], shuffled[~in_train], None
+
+    n_baseline = np.minimum(2 * n_train, sizes)
+    if remove_baseline:
+        holdout_pos = shuffled[rank >= n_baseline[shuffled_strata]]
+    else:
+        holdout_pos = shuffled[~in_train]
+        if extend_baseline:
+            # Extend the baseline with another train-sized draw where the stratum has room
+            room = sizes - n_baseline >= n_train
+            n_baseline = np.where(room, n_baseline + n_train, n_baseline)
+
+    return shuffled[in_train], holdout_pos, shuffled[rank < n_baseline[shuffled_strata]]
+
+
+def strata_codes(df: pd.DataFrame, columns: list, min_stratum_size: int = MIN_STRATUM_SIZE):
+    """
+    Joint stratum code of each row over the given columns.
+    Rare cells are merged by coarsening: rows whose joint cell has fewer than min_stratum_size
+    rows fall back to the cell of the leading columns only, and rows still in rare cells
+    at the coarsest level share one pooled stratum.
+    """
+    n_rows = len(df)
+    codes = np.full(n_rows, -1, dtype=np.int64)
+    next_code = 0
+
+    for depth in range(len(columns), 0, -1):
+        pending = codes < 0
+        if not pending.any():
+            break
+        cells = df.groupby(list(columns[:depth]), sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        sizes = np.bincount(cells[pending], minlength=cells.max() + 1)
+        keep = pending & (sizes[cells] >= min_stratum_size)
+        kept_cells, codes[keep] = np.unique(cells[keep], return_inverse=True)
+        codes[keep] += next_code
+        next_code += len(kept_cells)
+
+    codes[codes < 0] = next_code  # Pooled stratum for what is left
+    return np.unique(codes, return_inverse=True)[1]
+
+
+def _sorted(*parts):
+    return [None if part is None else np.sort(part) for part in parts]
+
+
+@perf_utils.timed("split")
+def random_split(df: pd.DataFrame, train_size: float = 0.1, baseline: bool = True, remove_baseline: bool = True, random_states=None,
+                 stratify: list = None, min_stratum_size: int = MIN_STRATUM_SIZE):
+    """
+    Splits the dataset into train, holdout, and optionally a baseline.
+    `stratify` lists columns whose joint distribution each part should preserve.
+    Returns one SplitPlan per random state.
+    """
+    if not isinstance(random_states, list):
+        random_states = [None]  # Default to a single random split without a seed
+
+    positions = np.arange(len(df))
+    strata = strata_codes(df, stratify, min_stratum_size) if stratify else None
+    plans = []
+
+    for seed in random_states:
+        rng = np.random.default_rng(seed)
+        train, holdout, baseline_pos = _sorted(*_split_positions(positions, rng, train_size, baseline, remove_baseline, strata=strata))
+        plans.append(SplitPlan(train, holdout, baseline_pos, seed=seed))
+
+    return plans
+
+
+@perf_utils.timed("filter")
+def filter_dataframe(data: pd.DataFrame, filters: list, index: filter_utils.SegmentIndex = None):
     """
     Filters a DataFrame based on a list of column-value mappings from JSON.
+    Pass a prebuilt SegmentIndex to reuse its encodings across calls.
     """
     if not filters:
         return data, pd.DataFrame()  
-    filtered_df = data.copy()
-    
-    for filter_dict in filters:
-        for column, values in filter_dict.items():
 
-            if column in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df[column].isin(values)]
-    
-    remaining_df = data.drop(filtered_df.index)
+    conditions = [c for c in filter_utils.conditions_from_dicts(filters) if c["column"] in data.columns]
+    mask = (index or filter_utils.SegmentIndex(data)).mask(conditions)
 
-    return filtered_df, remaining_df
+    return data[mask], data[~mask]
 
 
-def plot_training_holdout(total_training_size, holdout_size, segment_training_size):
+def training_holdout_figure(total_training_size, holdout_size, segment_training_size):
+    import matplotlib.pyplot as plt  # Imported lazily so headless runs don't pay for it
+
     fig, ax = plt.subplots(figsize=(5, 6))
 
     rest_training_size = total_training_size - segment_training_size
@@ -96,70 +229,193 @@ def plot_training_holdout(total_training_size, holdout_size, segment_training_si
     )
 
     fig.tight_layout() 
+    return fig
+
+
+@perf_utils.timed("plot")
+def training_holdout_png(total_training_size, holdout_size, segment_training_size):
+    """Renders the training/holdout donut to PNG bytes."""
+    import matplotlib.pyplot as plt
+
+    fig = training_holdout_figure(total_training_size, holdout_size, segment_training_size)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def plot_training_holdout(total_training_size, holdout_size, segment_training_size):
+    import streamlit as st
+
+    fig = training_holdout_figure(total_training_size, holdout_size, segment_training_size)
     st.pyplot(fig, clear_figure=True)
 
 
-def targeted_split(df: pd.DataFrame, filters: list, train_size: float = 0.1, baseline: bool = True, remove_baseline: bool = True, random_states=None):
+@perf_utils.timed("filter")
+def segment_mask(df: pd.DataFrame, filters: list, index: filter_utils.SegmentIndex = None):
+    """
+    Returns a boolean NumPy mask of the rows matching every filter condition
+    (see filter_utils.SegmentIndex for the condition format).
+    """
+    return (index or filter_utils.SegmentIndex(df)).mask(filters)
+
+
+@perf_utils.timed("split")
+def targeted_split(df: pd.DataFrame, filters: list, train_size: float = 0.1, baseline: bool = True, remove_baseline: bool = True, random_states=None,
+                   stratify: list = None, min_stratum_size: int = MIN_STRATUM_SIZE):
     """
     Splits the dataset into train, holdout, and optionally a baseline, based on specific segment filters.
+    Rows outside the segment always go to train; `stratify` stratifies the split of the segment.
+    Returns one SplitPlan per random state.
     """
     if not isinstance(random_states, list):
         random_states = [None]  # Default to a single split with no specific seed
-    
-    # Apply filtering based on the conditions
-    mask = pd.Series(True, index=df.index)
-    for condition in filters:
-        column, values = condition["column"], condition["values"]
-        mask &= df[column].isin(values)
-    
-    segment_df = df[mask]  # Data matching the filter conditions
-    rest_df = df[~mask]  # Data that doesn't match the filter conditions
-    
-    results = []
-    
+
+    mask = segment_mask(df, filters)
+    segment_pos = np.flatnonzero(mask)  # Rows matching the filter conditions
+    rest_pos = np.flatnonzero(~mask)  # Rows that don't match the filter conditions
+    strata = strata_codes(df.iloc[segment_pos], stratify, min_stratum_size) if stratify else None
+
+    plans = []
+
     for seed in random_states:
-        if not baseline:
-            # No baseline, just a train-test split
-            if len(segment_df) == 0:
-                train_df, holdout_df = rest_df, pd.DataFrame()
-            else:
-                train_segment, holdout_segment = train_test_split(segment_df, train_size=train_size, random_state=seed)
-                train_df = pd.concat([train_segment, rest_df])
-                holdout_df = holdout_segment
-            results.append((train_df, holdout_df, None))
+        if len(segment_pos) == 0:
+            plans.append(SplitPlan(rest_pos, segment_pos, None, seed=seed))
             continue
-        
-        # Compute baseline size (2x train_size of the segment)
-        baseline_size = min(2 * train_size, 1.0)  # Ensure it doesn't exceed available data
-        if len(segment_df) == 0:
-            results.append((rest_df, pd.DataFrame(), None))
+
+        rng = np.random.default_rng(seed)
+        train_segment, holdout, baseline_pos = _sorted(*_split_positions(
+            segment_pos, rng, train_size, baseline, remove_baseline, extend_baseline=True, strata=strata
+        ))
+
+        # Add the rest of the data to train, keeping source row order
+        train = np.sort(np.concatenate([train_segment, rest_pos]))
+
+        plans.append(SplitPlan(train, holdout, baseline_pos, seed=seed))
+
+    return plans
+
+
+def bootstrap_labels(n_rows: int, n_replicates: int, train_size: float = 0.1, baseline: bool = True,
+                     remove_baseline: bool = True, segment: np.ndarray = None, seed=None, strata: np.ndarray = None):
+    """
+    Generates every replicate assignment at once as an (n_replicates x n_rows) uint8 matrix
+    of TRAIN / HOLDOUT / BASELINE flags.
+
+    Each replicate draws from its own stream spawned from a single Generator seeded with `seed`,
+    so replicate i is reproducible from (seed, i) and streams never collide.
+    When `segment` (a boolean mask) is given, only segment rows are split and the rest go to train,
+    as in targeted_split. `strata` (one code per row, see strata_codes) stratifies the split.
+    """
+    labels = np.zeros((n_replicates, n_rows), dtype=np.uint8)
+
+    if segment is None:
+        candidates = np.arange(n_rows)
+    else:
+        candidates = np.flatnonzero(segment)
+        labels[:, ~segment] = TRAIN  # Rows outside the segment always train
+
+    if len(candidates) == 0:
+        return labels
+
+    if strata is not None:
+        # Re-number the strata present among the candidates
+        strata = np.unique(strata[candidates], return_inverse=True)[1]
+
+    for row, rng in zip(labels, np.random.default_rng(seed).spawn(n_replicates)):
+        train, holdout, baseline_pos = _split_positions(
+            candidates, rng, train_size, baseline, remove_baseline, extend_baseline=segment is not None, strata=strata
+        )
+        row[train] |= TRAIN
+        row[holdout] |= HOLDOUT
+        if baseline_pos is not None:
+            row[baseline_pos] |= BASELINE
+
+    return labels
+
+
+@perf_utils.timed("split")
+def bootstrap_split(df: pd.DataFrame, n_replicates: int, filters: list = None, train_size: float = 0.1,
+                    baseline: bool = True, remove_baseline: bool = True, seed=None,
+                    index: filter_utils.SegmentIndex = None, stratify: list = None,
+                    min_stratum_size: int = MIN_STRATUM_SIZE):
+    """
+    Batched counterpart of random_split / targeted_split: returns the label matrix for
+    n_replicates splits of df (targeted when filters are given, stratified when stratify is given).
+    """
+    segment = segment_mask(df, filters, index=index) if filters is not None else None
+    strata = None
+    if stratify:
+        # Strata are formed among the rows actually being split
+        frame = df if segment is None else df[segment]
+        strata = np.zeros(len(df), dtype=np.int64)
+        strata[slice(None) if segment is None else segment] = strata_codes(frame, stratify, min_stratum_size)
+
+    return bootstrap_labels(len(df), n_replicates, train_size, baseline, remove_baseline, segment=segment, seed=seed, strata=strata)
+
+
+def output_name(part: str, n_rows: int, file_type: str, replicate: int = None):
+    """File name of a split output: <part>_<rows>[_batch_<replicate>].<file_type>."""
+    suffix = f"_batch_{replicate}" if replicate else ""
+    return f"{part}_{n_rows}{suffix}.{file_type}"
+
+
+def output_jobs(labels: np.ndarray, output_dir: str, file_type: str, has_baseline: bool = True, bootstrap: bool = False,
+                replicates: list = None, parts: list = None):
+    """
+    Lists the (file_path, rows) export jobs for every replicate of a label matrix,
+    named <part>_<rows>[_batch_<n>].<file_type> like the Split Data buttons.
+    `replicates` restricts the export to those 1-based replicate numbers, `parts` to those part names.
+    """
+    jobs = []
+    for idx, replicate_labels in enumerate(labels):
+        if replicates is not None and idx + 1 not in replicates:
             continue
-        
-        baseline_df, holdout_segment = train_test_split(segment_df, train_size=baseline_size, random_state=seed)
-        
-        # Train is half of the baseline
-        train_df, _ = train_test_split(baseline_df, train_size=0.5, random_state=seed)
-        
-        if remove_baseline:
-            # Holdout should exclude the entire baseline
-            holdout_df = holdout_segment.loc[~holdout_segment.index.isin(baseline_df.index)]
-        else:
-            # Holdout should only exclude the train portion
-            holdout_df = holdout_segment.loc[~holdout_segment.index.isin(train_df.index)]
-            
-            # Extend the baseline with another train-sized sample from the segment (without replacement)
-            if len(holdout_segment) >= len(train_df):
-                extra_baseline_sample = holdout_segment.sample(n=len(train_df), random_state=seed, replace=False)
-                baseline_df = pd.concat([baseline_df, extra_baseline_sample])
-        
-        # Add the rest of the data to train
-        train_df = pd.concat([train_df, rest_df])
-        
-        results.append((train_df, holdout_df, baseline_df))
-    
-    return results
+        plan = SplitPlan.from_labels(replicate_labels, has_baseline=has_baseline)
+        plan_parts = [("train", plan.train), ("holdout", plan.holdout)]
+        if has_baseline:
+            plan_parts.append(("baseline", plan.baseline))
+
+        for name, rows in plan_parts:
+            if parts is not None and name not in parts:
+                continue
+            jobs.append((os.path.join(output_dir, output_name(name, len(rows), file_type, idx + 1 if bootstrap else None)), rows))
+
+    return jobs
+
+
+def file_labels(file_path: str, n_replicates: int = 1, filters: list = None, train_size: float = 0.1,
+                baseline: bool = True, remove_baseline: bool = True, seed=None,
+                stratify: list = None, min_stratum_size: int = MIN_STRATUM_SIZE):
+    """
+    Label matrix of a CSV or SAV file (see bootstrap_split), reading only its row count and the
+    filter and stratification columns. Returns (labels, meta).
+    """
+    n_rows, _, meta = files_utils.read_file_info(file_path)
+
+    columns = list(dict.fromkeys(filter_utils.condition_columns(filters or []) + list(stratify or [])))
+    projection, _ = files_utils.load_columns(file_path, columns) if columns else (pd.DataFrame(index=range(n_rows)), None)
 
+    labels = bootstrap_split(
+        projection, n_replicates, filters=filters, train_size=train_size, baseline=baseline,
+        remove_baseline=remove_baseline, seed=seed, stratify=stratify, min_stratum_size=min_stratum_size
+    )
+    return labels, meta
 
 
+def split_file(file_path: str, output_dir: str, n_replicates: int = 1, filters: list = None, train_size: float = 0.1,
+               baseline: bool = True, remove_baseline: bool = True, seed=None, progress=None,
+               stratify: list = None, min_stratum_size: int = MIN_STRATUM_SIZE):
+    """
+    Splits a CSV or SAV file without loading it whole: only the row count and the filter and
+    stratification columns are read to compute the assignments, then the full rows are streamed
+    to the outputs. Returns (output paths, {output_path: error dict} for failed outputs).
+    """
+    labels, meta = file_labels(file_path, n_replicates, filters, train_size, baseline, remove_baseline, seed,
+                               stratify, min_stratum_size)
 
+    file_type = file_path.rsplit(".", 1)[-1].lower()
+    jobs = output_jobs(labels, output_dir, file_type, has_baseline=baseline, bootstrap=n_replicates > 1)
 
+    errors = files_utils.stream_export(file_path, jobs, metadata=meta, progress=progress)
+    return [path for path, _ in jobs], errors
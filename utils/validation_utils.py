@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import rel_entr
+
+
+PROFILE_COLUMNS = ["column", "value", "count", "total"]
+PSI_EPSILON = 1e-4  # Floor for proportions in PSI, which is undefined for empty categories
+MAX_VALUES_PER_COLUMN = 20  # Value rows shown per column, the others are folded into one "Other" row
+
+
+def _profile_columns(df):
+    """Frequency table of each column of df, from factorized codes and one bincount per column."""
+    columns, values, counts, totals = [], [], [], []
+    for column in df.columns:
+        codes, uniques = pd.factorize(df[column], use_na_sentinel=True)
+        column_counts = np.bincount(codes[codes >= 0], minlength=len(uniques))  # Missing values are not counted
+        columns.append(np.full(len(uniques), len(columns), dtype=np.int64))
+        values.append(np.asarray(uniques, dtype=object))
+        counts.append(column_counts)
+        totals.append(np.full(len(uniques), column_counts.sum(), dtype=np.int64))
+
+    if not columns:
+        return pd.DataFrame(columns=PROFILE_COLUMNS)
+
+    # Build the frame once rather than one small frame per column
+    return pd.DataFrame({
+        "column": np.asarray(df.columns, dtype=object)[np.concatenate(columns)],
+        "value": np.concatenate(values),
+        "count": np.concatenate(counts),
+        "total": np.concatenate(totals),
+    })
+
+
+def frequency_profile(df: pd.DataFrame, columns=None):
+    """
+    Returns the value frequencies of every column as a single tidy frame
+    with one (column, value, count, total) row per observed value.
+    Columns are profiled in-process: a process pool cost more in startup and pickling
+    the column slices than it saved, even at 600 columns.
+    """
+    columns = list(df.columns if columns is None else columns)
+    return _profile_columns(df[columns])
+
+
+def compare_profiles(profile1: pd.DataFrame, profile2: pd.DataFrame):
+    """
+    Aligns two frequency profiles on their common columns.
+    Returns a tidy frame with counts and percentages of each value in both datasets.
+    """
+    common = profile2["column"].isin(set(profile1["column"]))
+    profile1 = profile1[profile1["column"].isin(set(profile2["column"]))]
+    profile2 = profile2[common]
+
+    merged = pd.merge(
+        profile1[["column", "value", "count"]], profile2[["column", "value", "count"]],
+        on=["column", "value"], how="outer", suffixes=("_df1", "_df2"), sort=False
+    )
+    merged[["count_df1", "count_df2"]] = merged[["count_df1", "count_df2"]].fillna(0).astype(np.int64)
+
+    for suffix in ("df1", "df2"):
+        totals = merged.groupby("column", sort=False)[f"count_{suffix}"].transform("sum")
+        merged[f"{suffix} (%)"] = (merged[f"count_{suffix}"] / totals.where(totals > 0) * 100).fillna(0)
+
+    # Keep the first frame's column order
+    order = {column: i for i, column in enumerate(pd.unique(profile1["column"]))}
+    merged["_order"] = merged["column"].map(order)
+    return merged.sort_values("_order", kind="stable").drop(columns="_order").reset_index(drop=True)
+
+
+def compare_frequencies(df1: pd.DataFrame, df2: pd.DataFrame):
+    """Compares the value distributions of the common columns of two DataFrames."""
+    df2_columns = set(df2.columns)
+    common_columns = [column for column in df1.columns if column in df2_columns]
+    return compare_profiles(
+        frequency_profile(df1, common_columns),
+        frequency_profile(df2, common_columns),
+    )
+
+
+def drift_scores(comparison: pd.DataFrame):
+    """
+    Per-column divergence between the df1 and df2 distributions of a comparison frame
+    (as returned by compare_profiles), ranked from most to least drifted by total variation distance.
+
+    - tvd: total variation distance, the share of probability mass that moved (0 to 1)
+    - chi2 / chi2_pvalue: chi-square test of homogeneity on the two count vectors
+    - js_distance: Jensen-Shannon distance in base 2 (0 to 1)
+    - psi: population stability index, with proportions floored at PSI_EPSILON
+    """
+    p = comparison["df1 (%)"].to_numpy() / 100
+    q = comparison["df2 (%)"].to_numpy() / 100
+    c1 = comparison["count_df1"].to_numpy(dtype=float)
+    c2 = comparison["count_df2"].to_numpy(dtype=float)
+    m = (p + q) / 2
+
+    by_column = comparison[["column"]].assign(
+        tvd=np.abs(p - q) / 2,
+        js=(rel_entr(p, m) + rel_entr(q, m)) / (2 * np.log(2)),
+        psi=(np.maximum(q, PSI_EPSILON) - np.maximum(p, PSI_EPSILON)) * np.log(np.maximum(q, PSI_EPSILON) / np.maximum(p, PSI_EPSILON)),
+        c1=c1, c2=c2, values=(c1 + c2 > 0).astype(int),
+    ).groupby("column", sort=False)
+    scores = by_column[["tvd", "js", "psi", "c1", "c2", "values"]].sum()
+
+    # Chi-square of homogeneity: expected counts from the pooled distribution of each value
+    n1 = scores["c1"].reindex(comparison["column"]).to_numpy()
+    n2 = scores["c2"].reindex(comparison["column"]).to_numpy()
+    pooled = (c1 + c2) / np.where(n1 + n2 > 0, n1 + n2, 1)
+    e1, e2 = n1 * pooled, n2 * pooled
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cells = np.where(e1 > 0, (c1 - e1) ** 2 / e1, 0) + np.where(e2 > 0, (c2 - e2) ** 2 / e2, 0)
+    scores["chi2"] = pd.Series(cells).groupby(comparison["column"].to_numpy(), sort=False).sum()
+
+    dof = (scores["values"] - 1).clip(lower=1)
+    scores["chi2_pvalue"] = stats.chi2.sf(scores["chi2"], dof)
+    scores["js_distance"] = np.sqrt(scores["js"].clip(lower=0))
+
+    scores = scores.drop(columns=["js", "c1", "c2", "values"]).sort_values("tvd", ascending=False)
+    scores.insert(0, "drift_rank", np.arange(1, len(scores) + 1))
+    return scores.reset_index()[["column", "drift_rank", "tvd", "chi2", "chi2_pvalue", "js_distance", "psi"]]
+
+
+def page_of_columns(scores: pd.DataFrame, search: str = "", sort_by: str = "drift", page: int = 1, page_size: int = 25):
+    """
+    Filters columns by a case-insensitive name search, sorts them by drift rank or by name,
+    and returns (scores of the requested page, number of pages).
+    """
+    if search:
+        scores = scores[scores["column"].astype(str).str.contains(search, case=False, regex=False)]
+
+    if sort_by == "name":
+        scores = scores.sort_values("column", key=lambda names: names.astype(str).str.lower(), kind="stable")
+    else:
+        scores = scores.sort_values("drift_rank", kind="stable")
+
+    n_pages = max(1, -(-len(scores) // page_size))
+    page = min(max(page, 1), n_pages)
+    return scores.iloc[(page - 1) * page_size:page * page_size], n_pages
+
+
+def subset_columns(comparison: pd.DataFrame, columns, max_values=MAX_VALUES_PER_COLUMN):
+    """
+    Rows of a comparison frame for the given columns, in that column order.
+    A column with more than max_values values keeps its most frequent ones (over both datasets)
+    and folds the rest into one "Other (n values)" row, so ID or free-text columns stay small.
+    """
+    order = {column: i for i, column in enumerate(columns)}
+    subset = comparison[comparison["column"].isin(order.keys())]
+    subset = subset.iloc[np.argsort(subset["column"].map(order).to_numpy(), kind="stable")]
+    if max_values is None:
+        return subset
+
+    weight = subset["count_df1"] + subset["count_df2"]
+    rank = weight.groupby(subset["column"].to_numpy(), sort=False).rank(method="first", ascending=False)
+    rest = subset[rank > max_values]
+    if rest.empty:
+        return subset
+
+    other = rest.groupby("column", sort=False).agg(
+        values=("value", "size"), count_df1=("count_df1", "sum"), count_df2=("count_df2", "sum"),
+        **{"df1 (%)": ("df1 (%)", "sum"), "df2 (%)": ("df2 (%)", "sum")},
+    ).reset_index()
+    other["value"] = "Other (" + other.pop("values").astype(str) + " values)"
+
+    # Kept values stay in their original order, with the "Other" row last in its column
+    kept = pd.concat([subset[rank <= max_values], other[subset.columns]], ignore_index=True)
+    is_other = np.r_[np.zeros(len(kept) - len(other), dtype=int), np.ones(len(other), dtype=int)]
+    return kept.iloc[np.lexsort((is_other, kept["column"].map(order).to_numpy()))].reset_index(drop=True)
@@ -0,0 +1,118 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from utils import files_utils, perf_utils, queue_utils
+
+
+WORKSPACE_ROOT = "workspaces"
+WORKSPACE_TTL = 24 * 3600  # Seconds of inactivity before a workspace is deleted
+CLEANUP_INTERVAL = 600  # Seconds between two cleanup sweeps
+ZIP_BLOCK_SIZE = 1 << 20
+DATASET_FILE = "dataset"  # Holds the path of the workspace's loaded dataset (often a cache entry)
+
+_last_cleanup = 0.0
+
+
+def create_workspace():
+    """Creates an isolated workspace with its own uploads/ and outputs/ folders and returns its id."""
+    workspace_id = uuid.uuid4().hex
+    for folder in ("uploads", "outputs"):
+        os.makedirs(workspace_path(workspace_id, folder), exist_ok=True)
+    return workspace_id
+
+
+def workspace_path(workspace_id, *parts):
+    return os.path.join(WORKSPACE_ROOT, workspace_id, *parts)
+
+
+def touch(workspace_id):
+    """Marks a workspace as in use, postponing its expiry. Recreates it if it was cleaned up."""
+    for folder in ("uploads", "outputs"):
+        os.makedirs(workspace_path(workspace_id, folder), exist_ok=True)
+    os.utime(workspace_path(workspace_id))
+
+
+def set_dataset(workspace_id, file_path):
+    """Records the dataset a workspace works on, so cache cleanup keeps it while the workspace lives."""
+    with open(workspace_path(workspace_id, DATASET_FILE), "w") as f:
+        f.write(file_path or "")
+
+
+def cleanup_workspaces(ttl=WORKSPACE_TTL, force=False):
+    """
+    Deletes workspaces unused for longer than ttl seconds, then evicts old cache entries
+    (see files_utils.evict_cache) except the datasets of live workspaces and of unfinished jobs.
+    Runs at most once per CLEANUP_INTERVAL.
+    """
+    global _last_cleanup
+    now = time.time()
+    if not force and now - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    _last_cleanup = now
+
+    if not os.path.isdir(WORKSPACE_ROOT):
+        return
+    for workspace_id in os.listdir(WORKSPACE_ROOT):
+        path = workspace_path(workspace_id)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path)
+        except Exception as e:
+            perf_utils.log("workspace_cleanup_failed", logging.WARNING, path=path, error=str(e))
+
+    keep = set(queue_utils.active_datasets())
+    for workspace_id in os.listdir(WORKSPACE_ROOT):
+        try:
+            with open(workspace_path(workspace_id, DATASET_FILE)) as f:
+                keep.add(f.read().strip())
+        except OSError:
+            pass
+    try:
+        files_utils.evict_cache(keep)
+    except Exception as e:
+        perf_utils.log("cache_cleanup_failed", logging.WARNING, error=str(e))
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object collecting what zipfile writes, so it can be yielded."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b"".join(chunks)
+
+
+def iter_zip(folder, names=None):
+    """
+    Yields a ZIP archive of every file in folder (or only the given file names), built on the fly
+    block by block, so no archive is ever staged on disk.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path) or (names is not None and name not in names):
+                continue
+            with open(path, "rb") as source, archive.open(name, "w", force_zip64=True) as target:
+                for block in iter(lambda: source.read(ZIP_BLOCK_SIZE), b""):
+                    target.write(block)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()